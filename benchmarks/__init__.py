@@ -0,0 +1 @@
+"""Benchmarks of the service, run with `python -m benchmarks`."""
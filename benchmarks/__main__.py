@@ -0,0 +1,318 @@
+"""
+Benchmark the endpoints and the check queue against a seeded database.
+
+The database gets --repositories rows, which are all registered in a generated
+forms file. git and ssh are replaced by fakes, see `benchmarks.fakes`, so the
+results only depend on the service and its database. By default, a temporary
+SQLite database is used; set SQLALCHEMY_DATABASE_URI to use another, empty one.
+All other settings of the service are taken from the environment as usual.
+
+    python -m benchmarks --repositories 100000 --requests 2000 --concurrency 4
+"""
+
+import json
+import logging
+import sys
+from argparse import ArgumentParser, Namespace
+from collections.abc import Callable, Iterator
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from itertools import batched
+from os import environ, pathsep
+from pathlib import Path
+from random import Random
+from statistics import quantiles
+from tempfile import TemporaryDirectory
+from time import perf_counter, sleep
+from typing import NamedTuple
+
+from . import fakes
+
+
+class Result(NamedTuple):
+    name: str
+    requests: int
+    seconds: float
+    p50: float
+    p99: float
+
+    def __str__(self) -> str:
+        return (
+            f"{self.name:<28} {self.requests / self.seconds:>10.1f}/s "
+            f"{self.p50 * 1000:>9.2f} ms {self.p99 * 1000:>9.2f} ms"
+        )
+
+
+def arguments() -> Namespace:
+    parser = ArgumentParser(prog="python -m benchmarks", description=__doc__)
+    parser.add_argument("--repositories", type=int, default=100_000)
+    parser.add_argument(
+        "--requests", type=int, default=1000, help="requests per endpoint"
+    )
+    parser.add_argument(
+        "--exports", type=int, default=5, help="requests per analytics export"
+    )
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument(
+        "--tasks", type=int, default=200, help="checks for the queue benchmark"
+    )
+    parser.add_argument(
+        "--git-latency", type=float, default=0.05, help="seconds per ls-remote"
+    )
+    parser.add_argument(
+        "--ssh-latency", type=float, default=0.5, help="seconds per lint"
+    )
+    parser.add_argument("--seed", type=int, default=0, help="random seed")
+    return parser.parse_args()
+
+
+def repository_url(i: int) -> str:
+    return f"codeberg.org/org{i % 1000}/repo{i}"
+
+
+def configure(directory: Path, args: Namespace) -> None:
+    """Set up the environment of the service, before it is imported"""
+    fakes.install(directory / "bin")
+    environ["PATH"] = f"{directory / 'bin'}{pathsep}{environ['PATH']}"
+    environ["FAKE_GIT_LATENCY"] = str(args.git_latency)
+    environ["FAKE_SSH_LATENCY"] = str(args.ssh_latency)
+
+    forms = directory / "repos.json"
+    forms.write_text(
+        json.dumps(
+            [
+                {"include_vars": {"project": repository_url(i)}}
+                for i in range(args.repositories)
+            ]
+        )
+    )
+    environ["FORMS_FILE"] = str(forms)
+    environ.setdefault("SQLALCHEMY_DATABASE_URI", f"sqlite:///{directory}/reuse.db")
+
+
+def seed(repositories: int) -> None:
+    """Fill the repository table. Every third repository is non-compliant, and
+    every tenth is behind the commit that the fake git reports."""
+    from reuse_api.compression import compress  # noqa: PLC0415
+    from reuse_api.models import Repository, Status, db  # noqa: PLC0415
+
+    if db.session.execute(db.select(db.func.count(Repository.url))).scalar_one():
+        sys.exit("The database has to be empty")
+
+    lint_output = compress("Congratulations! Your project is compliant")
+    spdx_output = compress("SPDXVersion: SPDX-2.1\n" * 500)
+    checked = datetime(2024, 1, 1)
+    for batch in batched(range(repositories), 10_000):
+        db.session.execute(
+            db.insert(Repository),
+            [
+                {
+                    "url": repository_url(i),
+                    "hash": fakes.HEAD if i % 10 else "b" * 40,
+                    "status": Status.OK if i % 3 else Status.BAD,
+                    "lint_code": 0 if i % 3 else 1,
+                    "lint_output_gz": lint_output,
+                    "spdx_output_gz": spdx_output,
+                    "last_access": checked + timedelta(seconds=i),
+                    "protocol": "https",
+                }
+                for i in batch
+            ],
+        )
+        db.session.commit()
+
+
+def measure(app, name: str, requests: list[Callable], concurrency: int) -> Result:
+    """Send the requests with `concurrency` clients, and time each of them"""
+
+    def client(chunk: list[Callable]) -> list[float]:
+        test_client = app.test_client()
+        latencies = []
+        for send in chunk:
+            started = perf_counter()
+            response = send(test_client)
+            # Read streamed responses to the end
+            response.get_data()
+            latencies.append(perf_counter() - started)
+            if response.status_code >= 500:  # noqa: PLR2004
+                raise RuntimeError(f"{name}: {response.status}")
+        return latencies
+
+    chunks = [requests[i::concurrency] for i in range(concurrency)]
+    started = perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        latencies = [t for chunk in pool.map(client, chunks) for t in chunk]
+    seconds = perf_counter() - started
+    if len(latencies) < 2:  # noqa: PLR2004
+        # Quantiles need two samples at least
+        return Result(name, len(latencies), seconds, latencies[0], latencies[0])
+    cuts = quantiles(latencies, n=100, method="inclusive")
+    return Result(name, len(latencies), seconds, cuts[49], cuts[98])
+
+
+def endpoints(app, args: Namespace) -> list[Result]:
+    from reuse_api.config import ADMIN_KEY, NB_REPOSITORY_BY_PAGINATION  # noqa: PLC0415
+
+    random = Random(args.seed)
+
+    def urls() -> list[str]:
+        return [
+            repository_url(random.randrange(args.repositories))
+            for _ in range(args.requests)
+        ]
+
+    pages = args.repositories * 2 // 3 // NB_REPOSITORY_BY_PAGINATION
+    admin = {"admin_key": ADMIN_KEY}
+    by_status = {"admin_key": ADMIN_KEY, "status": "non-compliant"}
+    cases: dict[str, list[Callable]] = {
+        "/badge": [lambda c, u=u: c.get(f"/badge/{u}") for u in urls()],
+        "/status": [lambda c, u=u: c.get(f"/status/{u}.json") for u in urls()],
+        "/info": [lambda c, u=u: c.get(f"/info/{u}") for u in urls()],
+        "/sbom": [lambda c, u=u: c.get(f"/sbom/{u}.spdx") for u in urls()],
+        "/projects": [
+            lambda c, p=random.randint(1, pages): c.get(f"/projects/page/{p}")
+            for _ in range(args.requests)
+        ],
+        "analytics all_projects": [
+            lambda c: c.post("/admin/analytics/all_projects.json", data=admin)
+        ]
+        * args.exports,
+        "analytics projects_by_status": [
+            lambda c: c.post("/admin/analytics/projects_by_status.json", data=by_status)
+        ]
+        * args.exports,
+    }
+    return [
+        measure(app, name, requests, args.concurrency)
+        for name, requests in cases.items()
+    ]
+
+
+# Parts of query plans that mean that the repository table is scanned or its
+# rows are sorted, in SQLite and in PostgreSQL
+UNINDEXED: tuple[str, ...] = ("SCAN repository", "USE TEMP B-TREE", "Seq Scan", "Sort")
+
+
+class Plan(NamedTuple):
+    query: str
+    statement: str
+    plan: str
+
+    @property
+    def indexed(self) -> bool:
+        return not any(part in self.plan for part in UNINDEXED)
+
+
+def query_plans(app) -> Iterator[Plan]:
+    """Yield the queries behind the busiest endpoints with the plans of the
+    database for them, to check that they use the indexes"""
+    from sqlalchemy import event  # noqa: PLC0415
+
+    from reuse_api.cache import compliant_projects  # noqa: PLC0415
+    from reuse_api.models import Repository, db  # noqa: PLC0415
+
+    queries: dict[str, Callable] = {
+        "find": lambda: Repository.find(repository_url(1)),
+        "lookup": lambda: Repository.lookup(repository_url(1)),
+        "lookup_many": lambda: Repository.lookup_many(
+            [repository_url(1), repository_url(2)]
+        ),
+        "projects": lambda: (compliant_projects.clear(), Repository.projects(page=2)),
+        "least_recently_checked": lambda: next(
+            Repository.least_recently_checked(batch=10)
+        ),
+    }
+    recorded: list[tuple[str, object]] = []
+    statements: list[tuple[str, str, object]] = []
+
+    def record(_conn, _cursor, statement: str, parameters, *_) -> None:
+        if statement.lstrip().upper().startswith("SELECT"):
+            recorded.append((statement, parameters))
+
+    with app.app_context():
+        event.listen(db.engine, "before_cursor_execute", record)
+        try:
+            for name, run in queries.items():
+                run()
+                statements.extend((name, *r) for r in recorded)
+                recorded.clear()
+        finally:
+            event.remove(db.engine, "before_cursor_execute", record)
+
+        sqlite = db.engine.dialect.name == "sqlite"
+        explain = "EXPLAIN QUERY PLAN" if sqlite else "EXPLAIN"
+        connection = db.session.connection()
+        for name, statement, parameters in statements:
+            rows = connection.exec_driver_sql(f"{explain} {statement}", parameters)
+            yield Plan(
+                name,
+                " ".join(statement.split()),
+                "\n".join(str(row[-1]) for row in rows),
+            )
+
+
+def queue_throughput(app, args: Namespace) -> tuple[float, float]:
+    """Force a check of `args.tasks` repositories, and return the rate at which
+    they were enqueued and the rate at which the runners finished them"""
+    from reuse_api.models import Repository  # noqa: PLC0415
+
+    with app.app_context():
+        records = [Repository.lookup(repository_url(i)) for i in range(args.tasks)]
+
+    started = perf_counter()
+    for _ in app.scheduler.refresh_many(records, force=True):
+        pass
+    enqueued = perf_counter() - started
+    while app.scheduler.pending():
+        sleep(0.01)
+    finished = perf_counter() - started
+    return args.tasks / enqueued, args.tasks / finished
+
+
+def main() -> None:
+    args = arguments()
+    with TemporaryDirectory(prefix="reuse-api-benchmark-") as directory:
+        configure(Path(directory), args)
+        from reuse_api import create_app  # noqa: PLC0415
+        from reuse_api.config import NB_RUNNER, TASK_QUEUE  # noqa: PLC0415
+
+        app = create_app()
+        app.logger.setLevel(logging.WARNING)
+        try:
+            started = perf_counter()
+            with app.app_context():
+                seed(args.repositories)
+            out = sys.stdout
+            out.write(
+                f"Seeded {args.repositories} repositories in "
+                f"{perf_counter() - started:.1f} s\n\n"
+            )
+
+            unindexed: list[str] = []
+            for plan in query_plans(app):
+                indented = "".join(f"    {line}\n" for line in plan.plan.splitlines())
+                flag = "" if plan.indexed else "  <-- NOT USING AN INDEX"
+                out.write(f"{plan.query}: {plan.statement}{flag}\n{indented}")
+                if not plan.indexed:
+                    unindexed.append(plan.query)
+            out.write("\n")
+
+            enqueued, finished = queue_throughput(app, args)
+            out.write(
+                f"Check queue ({TASK_QUEUE}, {NB_RUNNER} runners, "
+                f"{args.ssh_latency} s per lint): {enqueued:.1f} checks/s "
+                f"enqueued, {finished:.1f} checks/s finished\n\n"
+            )
+
+            out.write(f"{'Endpoint':<28} {'Throughput':>12} {'p50':>12} {'p99':>12}\n")
+            for result in endpoints(app, args):
+                out.write(f"{result}\n")
+
+            if unindexed:
+                sys.exit(f"Queries that do not use an index: {', '.join(unindexed)}")
+        finally:
+            app.scheduler.join()
+
+
+if __name__ == "__main__":
+    main()
@@ -9,15 +9,23 @@ from atexit import register as atexit_register
 from os import R_OK, access, environ, path
 
 from flask import Flask
+from werkzeug.middleware.proxy_fix import ProxyFix
 
 from reuse_api import config
 from reuse_api.views import HTML, JSON
 
+from . import metrics
+from .migrations import migrate
 from .models import db
 from .scheduler import Scheduler
 
 
-def create_app() -> Flask:
+def create_app(runners: bool | None = None) -> Flask:
+    """Create the app. Whether it runs the lint runners itself defaults to
+    RUNNER_MODE, see `reuse_api.worker` for the alternative."""
+    if runners is None:
+        runners = config.RUNNER_MODE == "embedded"
+
     # Disable git prompt
     environ["GIT_TERMINAL_PROMPT"] = "0"
 
@@ -29,11 +37,19 @@ def create_app() -> Flask:
         raise PermissionError(
             "FORMS_FILE is not readable:", path.abspath(config.FORMS_FILE)
         )
+    if config.RUNNER_MODE == "separate" and config.TASK_QUEUE != "database":
+        raise ValueError("RUNNER_MODE 'separate' requires TASK_QUEUE 'database'")
+    if config.LINT_BACKEND not in {"ssh", "local"}:
+        raise ValueError(f"Unknown LINT_BACKEND: {config.LINT_BACKEND}")
 
     # Create and configure the app
     app: Flask = Flask(__name__.split(".")[0])
     app.config.from_object(config)
     app.logger.setLevel(logging.DEBUG)
+    if config.PROXY_HOPS:
+        app.wsgi_app = ProxyFix(
+            app.wsgi_app, x_for=config.PROXY_HOPS, x_proto=config.PROXY_HOPS
+        )
 
     app.register_blueprint(HTML)
     app.register_blueprint(JSON)
@@ -44,9 +60,11 @@ def create_app() -> Flask:
     db.init_app(app)
     with app.app_context():
         db.create_all()
+        migrate()
+        metrics.init_app(app, db.engine)
 
     # Initialize scheduler
-    app.scheduler = Scheduler(app)
+    app.scheduler = Scheduler(app, runners=runners)
     # FIXME: This is ideally only run when the app is fully "started", but I
     # can't find documentation for this.
     app.scheduler.run()
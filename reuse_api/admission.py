@@ -0,0 +1,57 @@
+"""Admission control for work that requests trigger on the forges."""
+
+from collections import Counter
+from collections.abc import Iterator
+from contextlib import contextmanager
+from threading import Lock
+
+from werkzeug.exceptions import ServiceUnavailable, TooManyRequests
+
+from .config import PROBE_ADMISSION_LIMIT, PROBE_ADMISSION_PER_CLIENT, PROBE_RETRY_AFTER
+
+
+class Admission:
+    """
+    Limits how many requests of this process may probe forges at the same
+    time, in total and per client. Requests over a limit are refused right away
+    instead of waiting, with 429 if the client has too many running itself and
+    503 if the process is busy.
+    """
+
+    def __init__(self, limit: int, per_client: int, retry_after: int):
+        self._limit = limit
+        self._per_client = per_client
+        self._retry_after = retry_after
+        self._active: Counter[str] = Counter()
+        self._lock = Lock()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._active.total()
+
+    @contextmanager
+    def admit(self, client: str) -> Iterator[None]:
+        """Hold a slot for `client` for the duration of the block"""
+        with self._lock:
+            if self._active[client] >= self._per_client:
+                raise TooManyRequests(
+                    "Too many repositories are being checked for you at once.",
+                    retry_after=self._retry_after,
+                )
+            if self._active.total() >= self._limit:
+                raise ServiceUnavailable(
+                    "Too many repositories are being checked at once.",
+                    retry_after=self._retry_after,
+                )
+            self._active[client] += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._active[client] -= 1
+                if not self._active[client]:
+                    del self._active[client]
+
+
+# ls-remote probes run while a request waits, e.g. to validate a registration
+probes = Admission(PROBE_ADMISSION_LIMIT, PROBE_ADMISSION_PER_CLIENT, PROBE_RETRY_AFTER)
@@ -0,0 +1,126 @@
+"""Small process-local caches for hot lookups."""
+
+from collections import OrderedDict
+from collections.abc import Callable, Iterable
+from threading import Lock
+from time import monotonic
+from typing import Any
+
+from .config import (
+    BADGE_CACHE_SIZE,
+    BADGE_CACHE_TTL,
+    HEAD_CACHE_SIZE,
+    HEAD_FRESHNESS,
+    INVALID_URL_CACHE_SIZE,
+    INVALID_URL_CACHE_TTL,
+    PROJECTS_CACHE_TTL,
+)
+
+
+class TTLCache:
+    """
+    Thread-safe LRU cache whose entries also expire after `ttl` seconds. Once
+    `maxsize` entries are stored, the least recently used one is evicted.
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self._maxsize = maxsize
+        self._ttl = ttl
+        self._data: OrderedDict[Any, tuple[float, Any]] = OrderedDict()
+        self._lock = Lock()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._data)
+
+    def get(self, key, default=None):
+        """Return the value for `key` if it is present and not expired"""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return default
+            expires, value = entry
+            if expires <= monotonic():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def put(self, key, value) -> None:
+        if self._maxsize <= 0:
+            return
+        with self._lock:
+            self._data[key] = (monotonic() + self._ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self._maxsize:
+                self._data.popitem(last=False)
+
+    def discard(self, key) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+
+class ProjectListing:
+    """
+    URLs of the compliant repositories, most recently checked first. The list
+    is loaded from the database at most every `ttl` seconds, and the results
+    of checks in this process are applied to it in between, so that readers
+    never query the database while it is fresh. Other processes do not see
+    these updates until the list is loaded again.
+    """
+
+    def __init__(self, ttl: float):
+        self._ttl = ttl
+        self._expires: float = 0
+        # Lower-cased URL to URL, least recently checked first
+        self._urls: OrderedDict[str, str] = OrderedDict()
+        # Most recently checked first, replaced on every change
+        self._snapshot: list[str] = []
+        self._lock = Lock()
+
+    def urls(self, load: Callable[[], Iterable[str]]) -> list[str]:
+        """Return the list, calling `load` for the URLs of all compliant
+        repositories, most recently checked first, if it has expired"""
+        with self._lock:
+            if self._expires <= monotonic():
+                self._snapshot = list(load())
+                self._urls = OrderedDict(
+                    (url.lower(), url) for url in reversed(self._snapshot)
+                )
+                self._expires = monotonic() + self._ttl
+            return self._snapshot
+
+    def update(self, url: str, compliant: bool) -> None:
+        """Move a repository that was just checked to the front of the list,
+        or remove it if it is not compliant anymore"""
+        with self._lock:
+            if self._expires <= monotonic():
+                # The next reader loads the list with the change
+                return
+            self._urls.pop(url.lower(), None)
+            if compliant:
+                self._urls[url.lower()] = url
+            self._snapshot = list(reversed(self._urls.values()))
+
+    def clear(self) -> None:
+        with self._lock:
+            self._expires = 0
+            self._urls.clear()
+            self._snapshot = []
+
+
+# Status of a repository by its lower-cased URL, as shown on its badge
+badge_cache = TTLCache(BADGE_CACHE_SIZE, BADGE_CACHE_TTL)
+
+# Latest (protocol, hash) of a repository by its lower-cased URL
+head_cache = TTLCache(HEAD_CACHE_SIZE, HEAD_FRESHNESS)
+
+# Lower-cased URLs that were submitted for registration, but do not exist
+invalid_cache = TTLCache(INVALID_URL_CACHE_SIZE, INVALID_URL_CACHE_TTL)
+
+# Compliant repositories for the project list and the counter on the home page
+compliant_projects = ProjectListing(PROJECTS_CACHE_TTL)
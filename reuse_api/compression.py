@@ -0,0 +1,41 @@
+"""Compression of the lint and SPDX outputs stored in the database."""
+
+import gzip
+import zlib
+from collections.abc import Iterator
+
+
+def compress(text: str | None) -> bytes | None:
+    """Compress text in the gzip format, so that it can be sent to clients that
+    accept gzip as it is"""
+    if text is None:
+        return None
+    # A fixed mtime keeps the result the same for the same text
+    return gzip.compress(text.encode("utf-8"), mtime=0)
+
+
+def decompress(blob: bytes | None) -> str | None:
+    if blob is None:
+        return None
+    return gzip.decompress(blob).decode("utf-8")
+
+
+def decompress_stream(blob: bytes, chunk_size: int = 64 * 1024) -> Iterator[bytes]:
+    """Decompress a blob piece by piece, yielding at most `chunk_size` bytes at
+    a time, so that the whole text is never held in memory"""
+    decompressor = zlib.decompressobj(wbits=zlib.MAX_WBITS | 16)  # gzip format
+    data = blob
+    while data:
+        if chunk := decompressor.decompress(data, chunk_size):
+            yield chunk
+        data = decompressor.unconsumed_tail
+    if rest := decompressor.flush():
+        yield rest
+
+
+def compressed(column: str) -> property:
+    """Text attribute of a model that is stored compressed in `column`"""
+    return property(
+        lambda self: decompress(getattr(self, column)),
+        lambda self, text: setattr(self, column, compress(text)),
+    )
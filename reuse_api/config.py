@@ -6,6 +6,11 @@ from os import getenv
 # Configuration for Flask
 SECRET_KEY: str = getenv("SECRET_KEY", default="secret_key")
 
+# Number of reverse proxies in front of the service that set X-Forwarded-For
+# and X-Forwarded-Proto. Client addresses, e.g. for PROBE_ADMISSION_PER_CLIENT,
+# are taken from that header instead of the connection then.
+PROXY_HOPS: int = int(getenv("PROXY_HOPS", default="0"))
+
 # Admin key for the REUSE API, necessary for some operations
 ADMIN_KEY: str = getenv("ADMIN_KEY", default="admin_key")
 
@@ -29,11 +34,119 @@ SSH_KNOW_HOST_PATH: str = getenv("SSH_KNOW_HOST_PATH", default="~/.ssh/known_hos
 SSH_PORT: int = int(getenv("SSH_PORT", default="22"))
 SSH_USER: str = getenv("SSH_USER", "reuse")
 
-# Servername
-REUSE_API: str = getenv("REUSE_API", "wrk1.api.reuse.software")
-
 # Number of maximum checks in queue
 NB_RUNNER: int = int(getenv("NB_RUNNER", default="6"))
 
+# Where repositories are linted: "ssh" runs `reuse_lint_repo` on the REUSE_API
+# hosts, "local" runs the REUSE tool on this host
+LINT_BACKEND: str = getenv("LINT_BACKEND", default="ssh")
+
+# Reuse the result of a commit that was already linted, e.g. for forks and
+# mirrors, instead of linting it again. Results unused for LINT_CACHE_DAYS days
+# are removed at most hourly, after a new result was stored.
+LINT_CACHE: bool = getenv("LINT_CACHE", default="1") == "1"
+LINT_CACHE_DAYS: int = int(getenv("LINT_CACHE_DAYS", default="30"))
+
+# Lint worker hosts, as a comma-separated list of `host` or `host=limit`,
+# where limit is the number of concurrent checks per process (default:
+# NB_RUNNER)
+REUSE_API: str = getenv("REUSE_API", "wrk1.api.reuse.software")
+
 # Number of repository return during pagination
 NB_REPOSITORY_BY_PAGINATION: int = int(getenv("NB_REPOSITORY_BY_PAGES", default="10"))
+
+# Maximum number of URLs in one request to the batch status endpoint
+STATUS_BATCH_LIMIT: int = int(getenv("STATUS_BATCH_LIMIT", default="500"))
+
+# Number of badge statuses kept in memory, and for how many seconds. Other
+# worker processes do not see invalidations, so keep the lifetime short.
+BADGE_CACHE_SIZE: int = int(getenv("BADGE_CACHE_SIZE", default="10000"))
+BADGE_CACHE_TTL: int = int(getenv("BADGE_CACHE_TTL", default="60"))
+
+# Seconds for which the list of compliant projects is kept in memory. Checks of
+# the same process update it right away, those of others after this time.
+PROJECTS_CACHE_TTL: int = int(getenv("PROJECTS_CACHE_TTL", default="60"))
+
+# Seconds during which a fetched HEAD of a repository is considered current.
+# Older entries are refreshed in the background by NB_REFRESHER threads.
+HEAD_FRESHNESS: int = int(getenv("HEAD_FRESHNESS", default="300"))
+HEAD_CACHE_SIZE: int = int(getenv("HEAD_CACHE_SIZE", default="100000"))
+NB_REFRESHER: int = int(getenv("NB_REFRESHER", default="2"))
+
+# Registrations of URLs that the forge reported as missing are refused without
+# probing again for INVALID_URL_CACHE_TTL seconds. Timeouts and unreachable
+# forges are not remembered. At most INVALID_URL_CACHE_SIZE URLs are kept.
+INVALID_URL_CACHE_SIZE: int = int(getenv("INVALID_URL_CACHE_SIZE", default="10000"))
+INVALID_URL_CACHE_TTL: int = int(getenv("INVALID_URL_CACHE_TTL", default="600"))
+
+# Concurrent ls-remote probes for requests, such as registrations, per process
+# and per client address. Requests above either limit are refused with 503 or
+# 429 and asked to retry after PROBE_RETRY_AFTER seconds. Both limits are kept
+# by every gunicorn worker on its own, so with 4 workers up to 4 times as many
+# probes run in total, and for one client.
+PROBE_ADMISSION_LIMIT: int = int(getenv("PROBE_ADMISSION_LIMIT", default="8"))
+PROBE_ADMISSION_PER_CLIENT: int = int(getenv("PROBE_ADMISSION_PER_CLIENT", default="2"))
+PROBE_RETRY_AFTER: int = int(getenv("PROBE_RETRY_AFTER", default="15"))
+
+# Concurrency of bulk HEAD refreshes: ls-remote processes in total, and per forge
+PROBE_WORKERS: int = int(getenv("PROBE_WORKERS", default="32"))
+PROBE_PER_HOST: int = int(getenv("PROBE_PER_HOST", default="4"))
+
+# Periodic re-check of all repositories: seconds between two runs (0 disables
+# it), repositories probed per second and per database batch, and the queue
+# size above which the run pauses to keep room for interactive requests
+FLEET_CHECK_INTERVAL: int = int(getenv("FLEET_CHECK_INTERVAL", default="0"))
+FLEET_CHECK_RATE: float = float(getenv("FLEET_CHECK_RATE", default="5"))
+FLEET_CHECK_BATCH: int = int(getenv("FLEET_CHECK_BATCH", default="100"))
+FLEET_QUEUE_LIMIT: int = int(getenv("FLEET_QUEUE_LIMIT", default=str(2 * NB_RUNNER)))
+
+# Number of times in a row a waiting lane of the check queue may be passed over
+# by higher priority tasks before it is served
+QUEUE_STARVATION_LIMIT: int = int(getenv("QUEUE_STARVATION_LIMIT", default="5"))
+
+# Where the check queue is kept: "memory" for a queue per process, or
+# "database" for a queue shared by all processes using the same database. Only
+# the database queue keeps waiting checks over a shutdown; the memory queue
+# drops them, so use "database" in production.
+TASK_QUEUE: str = getenv("TASK_QUEUE", default="memory")
+# Seconds a runner may work on a claimed task before others may claim it again.
+# It has to be longer than the lint timeout of 900 seconds.
+TASK_LEASE: int = int(getenv("TASK_LEASE", default="960"))
+# Seconds between two attempts of an idle runner to claim a task
+TASK_POLL_INTERVAL: float = float(getenv("TASK_POLL_INTERVAL", default="2"))
+# Number of times a task is claimed before it is dropped, e.g. because it keeps
+# crashing runners. Tasks handed back during a shutdown do not count.
+TASK_MAX_ATTEMPTS: int = int(getenv("TASK_MAX_ATTEMPTS", default="3"))
+
+# Where checks are run: "embedded" starts NB_RUNNER runners in every web
+# process, "separate" leaves them to `python -m reuse_api.worker` processes,
+# which requires the database TASK_QUEUE
+RUNNER_MODE: str = getenv("RUNNER_MODE", default="embedded")
+
+# Serve Prometheus metrics under /metrics. Lint workers serve them on
+# METRICS_PORT instead, if it is set.
+METRICS: bool = getenv("METRICS", default="0") == "1"
+# If set, /metrics is only served to requests with this bearer token
+METRICS_TOKEN: str = getenv("METRICS_TOKEN", default="")
+# Forges that get their own label in the metrics of fetching the latest commit,
+# as a comma-separated list of host names. All others are counted as "other".
+METRICS_FORGES: list[str] = getenv(
+    "METRICS_FORGES",
+    default=(
+        "codeberg.org,github.com,gitlab.com,git.fsfe.org,salsa.debian.org,"
+        "invent.kde.org,gitlab.gnome.org,gitlab.freedesktop.org,framagit.org,"
+        "git.sr.ht,bitbucket.org"
+    ),
+).split(",")
+METRICS_PORT: int = int(getenv("METRICS_PORT", default="0"))
+
+# Share one SSH master connection per lint worker host between all checks.
+# ControlPersist is how long an idle master is kept open.
+SSH_MULTIPLEX: bool = getenv("SSH_MULTIPLEX", default="0") == "1"
+SSH_CONTROL_PATH: str = getenv("SSH_CONTROL_PATH", default="~/.ssh/reuse-api-%C")
+SSH_CONTROL_PERSIST: str = getenv("SSH_CONTROL_PERSIST", default="600")
+
+# A lint worker host whose SSH connection fails SSH_EJECT_AFTER times in a row
+# gets no checks for SSH_EJECT_SECONDS
+SSH_EJECT_AFTER: int = int(getenv("SSH_EJECT_AFTER", default="3"))
+SSH_EJECT_SECONDS: int = int(getenv("SSH_EJECT_SECONDS", default="300"))
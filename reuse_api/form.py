@@ -1,12 +1,18 @@
 """RegisterForm class and it's filters & validators."""
 
-from flask import url_for
+from flask import request, url_for
 from flask_wtf import FlaskForm
 from wtforms import BooleanField, StringField, ValidationError
 from wtforms.validators import Email, InputRequired
 
+from .admission import probes
+from .cache import invalid_cache
 from .models import Repository
-from .scheduler import InvalidRepositoryError, determine_protocol
+from .scheduler import (
+    ForgeUnavailableError,
+    InvalidRepositoryError,
+    determine_protocol,
+)
 
 
 def sanitize_url(url: str) -> str:
@@ -25,17 +31,29 @@ class RegisterForm(FlaskForm):
     @staticmethod  # noqa as form is required
     def _validate_url(form, url_field) -> None:  # noqa: ARG004
         """Check if URL is an unregistered git repository"""
-        try:
-            determine_protocol(url_field.data)
-        except InvalidRepositoryError:
-            raise ValidationError("Not a Git repository")
-
+        # Registered projects are known to be repositories, so check that first
         if Repository.is_registered(url_field.data):
             info_page: str = url_for("html.info", url=url_field.data, _external=False)
             raise ValidationError(
                 f'Project is <a href="{info_page}">already registered</a>.'
             )
 
+        # URLs that recently turned out not to exist are not probed again
+        key: str = url_field.data.lower()
+        if invalid_cache.get(key):
+            raise ValidationError("Not a Git repository")
+
+        # Probing can take several seconds, so refuse to do it for too many
+        # requests at once
+        try:
+            with probes.admit(request.remote_addr or ""):
+                determine_protocol(url_field.data)
+        except ForgeUnavailableError:
+            raise ValidationError("Not a Git repository")
+        except InvalidRepositoryError:
+            invalid_cache.put(key, True)
+            raise ValidationError("Not a Git repository")
+
     name = StringField(label="Your name", validators=[InputRequired()])
     confirm = StringField(
         label="Your email",
@@ -0,0 +1,29 @@
+# SPDX-FileCopyrightText: Free Software Foundation Europe e.V.
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+"""
+Gunicorn settings, passed with `-c python:reuse_api.gunicorn_conf`.
+
+They are part of the package, so that a volume mounted over the working
+directory does not hide them.
+"""
+
+from os import environ
+from pathlib import Path
+
+from prometheus_client import multiprocess
+
+
+def on_starting(_server) -> None:
+    """Start with an empty directory for the metrics of the worker processes"""
+    if directory := environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        Path(directory).mkdir(parents=True, exist_ok=True)
+        for file in Path(directory).glob("*.db"):
+            file.unlink()
+
+
+def child_exit(_server, worker) -> None:
+    """Stop reporting the live gauges of a worker process that exited"""
+    if "PROMETHEUS_MULTIPROC_DIR" in environ:
+        multiprocess.mark_process_dead(worker.pid)
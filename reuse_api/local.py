@@ -0,0 +1,100 @@
+"""
+Linting on this host instead of on a lint worker host over SSH.
+
+Meant for single-node installs and for testing. Every check runs
+`python -m reuse_api.local <repository URL>` as a subprocess, which prints the
+same JSON as `reuse_lint_repo` on the lint worker hosts. The runners execute
+it like the SSH command, in a process group of its own. On a timeout or
+shutdown, the whole group gets SIGTERM, so the clone and REUSE processes stop
+too, and the scratch clone is removed before the command exits.
+"""
+
+import json
+import signal
+import subprocess
+import sys
+from tempfile import TemporaryDirectory
+from threading import BoundedSemaphore
+
+
+class LocalConnection:
+    """Stands in for `ssh.Connection`, running the lint command locally"""
+
+    host: str = "localhost"
+
+    def lint_command(self, protocol: str, url: str) -> list[str]:
+        return [sys.executable, "-m", __name__, f"{protocol}://{url}"]
+
+    def connect(self) -> bool:
+        return False
+
+    def reset(self) -> None:
+        pass
+
+
+class LocalWorkers:
+    """Stands in for `ssh.WorkerPool`, allowing `limit` concurrent checks"""
+
+    def __init__(self, limit: int):
+        self._connection = LocalConnection()
+        self._slots = BoundedSemaphore(limit)
+
+    def acquire(self, timeout: float) -> LocalConnection | None:
+        if self._slots.acquire(timeout=timeout):
+            return self._connection
+        return None
+
+    def release(self, connection: LocalConnection, failed: bool | None = None) -> bool:  # noqa: ARG002
+        self._slots.release()
+        return False
+
+
+def _run(*cmd: str, cwd: str | None = None) -> subprocess.CompletedProcess:
+    return subprocess.run(cmd, cwd=cwd, capture_output=True, text=True, check=False)
+
+
+def lint(url: str) -> dict[str, int | str] | None:
+    """
+    Shallow-clone the repository into a scratch directory, and run the REUSE
+    lint and SPDX generation on it. Return None if it cannot be cloned.
+    """
+    with TemporaryDirectory(prefix="reuse-api-") as scratch:
+        clone = _run("git", "clone", "--quiet", "--depth=1", "--", url, scratch)
+        if clone.returncode != 0:
+            sys.stderr.write(clone.stderr)
+            return None
+        result = _run("reuse", "lint", cwd=scratch)
+        spdx = _run("reuse", "spdx", cwd=scratch)
+    return {
+        "exit_code": result.returncode,
+        "lint_output": result.stdout,
+        "spdx_output": spdx.stdout if spdx.returncode == 0 else "",
+    }
+
+
+class _TerminatedError(Exception):
+    pass
+
+
+def _terminate(_signum, _frame) -> None:
+    raise _TerminatedError
+
+
+def main() -> None:
+    # Leave the scratch directory through the context manager on SIGTERM,
+    # then exit by it so that the runner sees that the check was stopped
+    signal.signal(signal.SIGTERM, _terminate)
+    try:
+        output = lint(sys.argv[1])
+    except _TerminatedError:
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        signal.raise_signal(signal.SIGTERM)
+        return
+    if output is None:
+        # Without output, the runner leaves the repository as it is
+        sys.exit(1)
+    sys.stdout.write(json.dumps(output) + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+"""
+Prometheus metrics of the service.
+
+Gunicorn runs several worker processes, which have to share their metrics. For
+that, PROMETHEUS_MULTIPROC_DIR has to point to an empty directory that all of
+them can write to, see `reuse_api.gunicorn_conf`. Without it, every process only
+reports its own metrics.
+"""
+
+from os import environ
+from time import perf_counter
+
+from flask import Flask, g, request
+from prometheus_client import (
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+from sqlalchemy import event
+
+from .config import METRICS_FORGES, TASK_QUEUE
+
+
+# Check queue
+# Every process has its own queue in memory, but a queue in the database is
+# counted by the process that is scraped.
+QUEUE_DEPTH = Gauge(
+    "reuse_api_queue_depth",
+    "Checks waiting in the queue",
+    ["lane"],
+    multiprocess_mode="livemostrecent" if TASK_QUEUE == "database" else "livesum",
+)
+QUEUE_WAIT = Histogram(
+    "reuse_api_queue_wait_seconds",
+    "Time checks waited in the queue until a runner took them",
+    ["lane"],
+    buckets=(1, 5, 15, 60, 300, 900, 3600, 4 * 3600, 24 * 3600),
+)
+
+# Runners
+LINT_DURATION = Histogram(
+    "reuse_api_lint_duration_seconds",
+    "Time it took to lint a repository, by outcome",
+    ["outcome"],
+    buckets=(1, 5, 10, 30, 60, 120, 300, 600, 900),
+)
+LINT_CACHE_HITS = Counter(
+    "reuse_api_lint_cache_hits",
+    "Checks that were finished with the result of an earlier check",
+)
+
+# Fetching the latest commit from the forges
+PROBE_DURATION = Histogram(
+    "reuse_api_probe_duration_seconds",
+    "Time it took to fetch the latest commit of a repository, by forge",
+    ["host"],
+    buckets=(0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30),
+)
+PROBE_FAILURES = Counter(
+    "reuse_api_probe_failures",
+    "Failed attempts to fetch the latest commit of a repository, by forge",
+    ["host"],
+)
+
+# Database and endpoints
+DB_QUERY_DURATION = Histogram(
+    "reuse_api_db_query_duration_seconds",
+    "Time database statements took, by type of statement",
+    ["statement"],
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1),
+)
+REQUEST_DURATION = Histogram(
+    "reuse_api_request_duration_seconds",
+    "Time it took to answer requests, by endpoint",
+    ["endpoint"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5),
+)
+
+
+# Hosts of submitted URLs are arbitrary, so only known forges are labelled by
+# name to keep the number of time series bounded
+FORGES: frozenset[str] = frozenset(
+    host.strip().lower() for host in METRICS_FORGES if host.strip()
+)
+
+
+def forge(url: str) -> str:
+    """Host name of a repository URL to label metrics by, or "other" if it is
+    not one of METRICS_FORGES"""
+    host = url.split("/", 1)[0].lower()
+    return host if host in FORGES else "other"
+
+
+def init_app(app: Flask, engine) -> None:
+    """Time the requests of the app, and the statements on its database"""
+
+    @app.before_request
+    def start_request_timer() -> None:
+        g.request_started = perf_counter()
+
+    @app.teardown_request
+    def stop_request_timer(_exc) -> None:
+        if (started := g.pop("request_started", None)) is not None:
+            REQUEST_DURATION.labels(request.endpoint or "none").observe(
+                perf_counter() - started
+            )
+
+    # A connection runs one statement at a time. The start of a statement that
+    # fails is dropped, so that it cannot be paired with a later one.
+    @event.listens_for(engine, "before_cursor_execute")
+    def start_query_timer(conn, *_) -> None:
+        conn.info["query_started"] = perf_counter()
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def stop_query_timer(conn, _cursor, statement: str, *_) -> None:
+        if (started := conn.info.pop("query_started", None)) is None:
+            return
+        kind = statement.lstrip().split(None, 1)[0].upper()
+        DB_QUERY_DURATION.labels(kind).observe(perf_counter() - started)
+
+    @event.listens_for(engine, "handle_error")
+    def drop_query_timer(context) -> None:
+        if context.connection is not None:
+            context.connection.info.pop("query_started", None)
+
+
+def registry() -> CollectorRegistry:
+    """Registry with the metrics of all processes"""
+    if "PROMETHEUS_MULTIPROC_DIR" not in environ:
+        return REGISTRY
+    collected = CollectorRegistry()
+    multiprocess.MultiProcessCollector(collected)
+    return collected
+
+
+def exposition() -> bytes:
+    """Metrics of all processes in the Prometheus text format"""
+    return generate_latest(registry())
@@ -0,0 +1,87 @@
+"""
+Schema changes for databases created by older versions of the service.
+
+`db.create_all()` only creates missing tables, so columns added to existing
+tables later on are applied here. Every step has to be idempotent, as all
+worker processes run them on startup.
+"""
+
+from sqlalchemy import Table, inspect, text
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.schema import CreateIndex
+
+from .compression import compress
+from .models import Repository, db
+
+
+def add_column(table: str, column: str, definition: str) -> None:
+    """Add a column to a table unless it already exists"""
+    if column in {c["name"] for c in inspect(db.engine).get_columns(table)}:
+        return
+    try:
+        db.session.execute(
+            text(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+        )
+        db.session.commit()
+    except DBAPIError:
+        # Another worker process may have added it in the meantime
+        db.session.rollback()
+        if column not in {c["name"] for c in inspect(db.engine).get_columns(table)}:
+            raise
+
+
+def create_indexes(table: Table) -> None:
+    """Create the indexes of a table that do not exist yet"""
+    for index in table.indexes:
+        statement = CreateIndex(index, if_not_exists=True)
+        try:
+            db.session.execute(statement)
+            db.session.commit()
+        except DBAPIError:
+            # Another worker process may have been creating it at the same time
+            db.session.rollback()
+            db.session.execute(statement)
+            db.session.commit()
+
+
+def compress_columns(
+    table: str, key: str, columns: tuple[str, ...], batch: int = 500
+) -> None:
+    """
+    Move the text of older versions in `columns` to their compressed `_gz`
+    counterparts, `batch` rows at a time. The text columns are emptied but
+    kept, so that processes of the older version keep working meanwhile.
+    """
+    existing = {c["name"] for c in inspect(db.engine).get_columns(table)}
+    blob = db.LargeBinary().compile(dialect=db.engine.dialect)
+    for column in columns:
+        add_column(table, f"{column}_gz", blob)
+    columns = tuple(c for c in columns if c in existing)
+    if not columns:
+        return
+
+    pending = " OR ".join(f"{column} IS NOT NULL" for column in columns)
+    select = text(
+        f"SELECT {key}, {', '.join(columns)} FROM {table} WHERE {pending} LIMIT :batch"
+    )
+    assignments = ", ".join(f"{c}_gz = :{c}, {c} = NULL" for c in columns)
+    update = text(f"UPDATE {table} SET {assignments} WHERE {key} = :key")
+    while rows := db.session.execute(select, {"batch": batch}).all():
+        db.session.execute(
+            update,
+            [
+                {"key": row[0]}
+                | {c: compress(v) for c, v in zip(columns, row[1:], strict=True)}
+                for row in rows
+            ],
+        )
+        db.session.commit()
+
+
+def migrate() -> None:
+    """Bring an existing database up to date with the models"""
+    add_column("repository", "protocol", "VARCHAR(5)")
+    add_column("task", "attempts", "SMALLINT NOT NULL DEFAULT 0")
+    compress_columns("repository", "url", ("lint_output", "spdx_output"))
+    compress_columns("lint_result", "hash", ("lint_output", "spdx_output"))
+    create_indexes(Repository.__table__)
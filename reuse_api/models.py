@@ -1,12 +1,19 @@
-import json
-from datetime import datetime
+from collections.abc import Iterable, Iterator
+from datetime import datetime, timedelta
 from enum import StrEnum
+from threading import Lock
+from time import monotonic
+from typing import NamedTuple
 
 from flask import current_app
 from flask_sqlalchemy import SQLAlchemy
 from sqlalchemy import orm
+from sqlalchemy.exc import IntegrityError
 
-from .config import FORMS_FILE, NB_REPOSITORY_BY_PAGINATION
+from .cache import badge_cache, compliant_projects
+from .compression import compressed, decompress
+from .config import NB_REPOSITORY_BY_PAGINATION
+from .registry import registrations
 
 
 db = SQLAlchemy()
@@ -25,12 +32,70 @@ class Status(StrEnum):
     OK = "compliant"
 
 
-def status(url: str) -> str:
+class RepositoryStatus(NamedTuple):
+    """Immutable snapshot of the status-related columns of a repository"""
+
+    url: str
+    status: str
+    hash: str | None
+    lint_code: int | None
+    last_access: datetime | None
+    protocol: str | None
+
+    @classmethod
+    def from_row(cls, row: "Repository") -> "RepositoryStatus":
+        return cls(
+            row.url,
+            row.status,
+            row.hash,
+            row.lint_code,
+            row.last_access,
+            row.protocol,
+        )
+
+    @property
+    def initialised(self) -> bool:
+        return self.last_access is not None
+
+    @property
+    def compliant(self) -> bool:
+        return self.status == Status.OK
+
+
+class Page(NamedTuple):
+    """One page of a list, with the attributes of a Flask-SQLAlchemy
+    pagination that the templates use"""
+
+    items: list
+    page: int
+    per_page: int
+    total: int
+
+    @property
+    def has_prev(self) -> bool:
+        return self.page > 1
+
+    @property
+    def prev_num(self) -> int:
+        return self.page - 1
+
+    @property
+    def has_next(self) -> bool:
+        return self.page * self.per_page < self.total
+
+    @property
+    def next_num(self) -> int:
+        return self.page + 1
+
+
+def status(url: str, record: RepositoryStatus | None = None) -> str:
     if not Repository.is_registered(url):
         return Status.NULL
-    if not Repository.is_initialised(url):
+    if record is None:
+        record = Repository.lookup(url)
+    if record is None or not record.initialised:
         return Status.EMPTY
-    if not Repository.is_compliant(url):
+    if not record.compliant:
         return Status.BAD
     return Status.OK
 
@@ -42,34 +107,39 @@ class Repository(db.Model):
     hash: str = db.Column(db.String(40))
     status: str = db.Column(db.String(13), default=Status.EMPTY)
     lint_code: int = db.Column(db.SmallInteger)
-    lint_output: str = db.Column(db.Text)
-    spdx_output: str = db.Column(db.Text)
+    # The outputs can be large, so they are stored compressed and only loaded
+    # when they are used
+    lint_output_gz = orm.deferred(db.Column(db.LargeBinary))
+    spdx_output_gz = orm.deferred(db.Column(db.LargeBinary))
     last_access = db.Column(db.DateTime())
+    protocol: str = db.Column(db.String(5))
+
+    lint_output = compressed("lint_output_gz")
+    spdx_output = compressed("spdx_output_gz")
+
+    __table_args__ = (
+        # Case-insensitive lookups by URL
+        db.Index("ix_repository_lower_url", db.func.lower(url)),
+        # Paginated list of compliant projects, most recently checked first
+        db.Index("ix_repository_status_last_access", status, last_access),
+        # Fleet checks, least recently checked first
+        db.Index("ix_repository_last_access_url", last_access, url),
+    )
 
     @staticmethod
     def is_registered(url: str) -> bool:
         """
         Ensure the user is registered and has validated their email from the `forms` app
         """
-        with open(FORMS_FILE) as f:
-            for project in json.load(f):
-                if project["include_vars"]["project"].lower() == url.lower():
-                    return True
-        return False
-
-    @classmethod
-    def is_initialised(cls, url: str) -> bool:
-        row = cls.query.filter_by(url=url).first()
-        if row is None:
-            return False
-
-        return row.last_access is not None
-
-    @classmethod
-    def is_compliant(cls, url: str) -> bool:
-        row = cls.query.filter_by(url=url).first()
+        return url in registrations
 
-        return row.status == Status.OK
+    @staticmethod
+    def registered(urls: Iterable[str]) -> list[str]:
+        """
+        Those of the URLs that are registered, reading the index only once
+        """
+        index = registrations.urls()
+        return [url for url in urls if url.lower() in index]
 
     @classmethod
     def create(cls, **kwargs):
@@ -88,6 +158,7 @@ class Repository(db.Model):
         record = cls(**kwargs)
         db.session.add(record)
         db.session.commit()
+        badge_cache.discard(record.url.lower())
         current_app.logger.info("Entry created: '%s'", kwargs.get("url"))
         return record
 
@@ -101,41 +172,162 @@ class Repository(db.Model):
         ).one_or_none()
 
     @classmethod
-    def projects(cls, page: int = 1):
+    def lookup(cls, url: str) -> RepositoryStatus | None:
         """
-        Produce a list of compliant repos, sorted by last_access, and paginate
+        Fetch only the status-related columns of a repository in one query
+        """
+        row = db.session.execute(
+            db.select(
+                cls.url,
+                cls.status,
+                cls.hash,
+                cls.lint_code,
+                cls.last_access,
+                cls.protocol,
+            ).where(db.func.lower(cls.url) == db.func.lower(url))
+        ).one_or_none()
+        return None if row is None else RepositoryStatus(*row)
+
+    @classmethod
+    def lookup_many(cls, urls: Iterable[str]) -> dict[str, RepositoryStatus]:
+        """
+        Fetch the status-related columns of many repositories in one query,
+        keyed by their lower-cased URL
+        """
+        keys = sorted({url.lower() for url in urls})
+        if not keys:
+            return {}
+        rows = db.session.execute(
+            db.select(
+                cls.url,
+                cls.status,
+                cls.hash,
+                cls.lint_code,
+                cls.last_access,
+                cls.protocol,
+            ).where(db.func.lower(cls.url).in_(keys))
+        )
+        return {row.url.lower(): RepositoryStatus(*row) for row in rows}
+
+    @classmethod
+    def least_recently_checked(cls, batch: int = 500) -> Iterator[RepositoryStatus]:
+        """
+        Yield the status of all repositories, those that were never checked
+        first and then by ascending last_access. Rows are fetched `batch` at a
+        time using keyset pagination.
+        """
+        columns = db.select(
+            cls.url,
+            cls.status,
+            cls.hash,
+            cls.lint_code,
+            cls.last_access,
+            cls.protocol,
+        )
+        # Never checked repositories, ordered by URL
+        after = None
+        while True:
+            query = columns.where(cls.last_access.is_(None))
+            if after is not None:
+                query = query.where(cls.url > after)
+            rows = db.session.execute(query.order_by(cls.url).limit(batch)).all()
+            yield from (RepositoryStatus(*row) for row in rows)
+            if len(rows) < batch:
+                break
+            after = rows[-1].url
+
+        # Checked repositories, ordered by (last_access, url)
+        after = None
+        while True:
+            query = columns.where(cls.last_access.is_not(None))
+            if after is not None:
+                query = query.where(db.tuple_(cls.last_access, cls.url) > after)
+            rows = db.session.execute(
+                query.order_by(cls.last_access, cls.url).limit(batch)
+            ).all()
+            yield from (RepositoryStatus(*row) for row in rows)
+            if len(rows) < batch:
+                break
+            after = (rows[-1].last_access, rows[-1].url)
+
+    @classmethod
+    def set_protocol(cls, url: str, protocol: str) -> None:
+        """
+        Remember the protocol under which the repository can be reached
+        """
+        db.session.execute(
+            db.update(cls)
+            .where(db.func.lower(cls.url) == db.func.lower(url))
+            .values(protocol=protocol)
+        )
+        db.session.commit()
+
+    @classmethod
+    def find_sbom(cls, url: str) -> str | None:
+        """
+        Load only the SPDX output of a repository
+        """
+        return decompress(cls.find_sbom_compressed(url))
+
+    @classmethod
+    def find_sbom_compressed(cls, url: str) -> bytes | None:
+        """
+        Load only the SPDX output of a repository, as it is stored in gzip format
+        """
+        return db.session.execute(
+            db.select(cls.spdx_output_gz).where(
+                db.func.lower(cls.url) == db.func.lower(url)
+            )
+        ).scalar_one_or_none()
+
+    @classmethod
+    def compliant_urls(cls) -> list[str]:
+        """
+        URLs of all compliant repos, most recently checked first. They are
+        kept in memory, see `cache.ProjectListing`.
         """
-        return (
-            cls.query.order_by(cls.last_access.desc())
-            .filter(cls.status == Status.OK)
-            .options(orm.load_only(cls.url))
-            .paginate(page=page, per_page=NB_REPOSITORY_BY_PAGINATION)
+        return compliant_projects.urls(
+            lambda: db.session.execute(
+                db.select(cls.url)
+                .where(cls.status == Status.OK)
+                .order_by(cls.last_access.desc())
+            ).scalars()
         )
 
     @classmethod
-    def all_projects(cls):
+    def projects(cls, page: int = 1) -> Page:
         """
-        Produce a list of all repos in the database with some of their
-        information
+        Produce a list of compliant repos, sorted by last_access, and paginate
         """
-        return [
-            {
-                "url": r.url,
-                "status": r.status,
-                "hash": r.hash,
-                "lint_code": r.lint_code,
-                "last_access": r.last_access,
-            }
-            for r in cls.query.all()
-        ]
+        urls = cls.compliant_urls()
+        start = (page - 1) * NB_REPOSITORY_BY_PAGINATION
+        return Page(
+            urls[start : start + NB_REPOSITORY_BY_PAGINATION],  # noqa: E203
+            page,
+            NB_REPOSITORY_BY_PAGINATION,
+            len(urls),
+        )
 
     @classmethod
-    def projects_by_status(cls, repo_status):
+    def export(cls, status: str | None = None, batch: int = 1000) -> Iterator[dict]:
         """
-        Produce a list of all repos in the database with some of their
-        information filtered by status
+        Yield some information about all repos in the database, or only those
+        with the given status, ordered by URL. Rows are fetched `batch` at a
+        time using keyset pagination.
         """
-        return [r for r in cls.all_projects() if r["status"] == repo_status]
+        columns = db.select(
+            cls.url, cls.status, cls.hash, cls.lint_code, cls.last_access
+        )
+        if status is not None:
+            columns = columns.where(cls.status == status)
+        after = None
+        while True:
+            query = columns if after is None else columns.where(cls.url > after)
+            rows = db.session.execute(query.order_by(cls.url).limit(batch)).all()
+            yield from (row._asdict() for row in rows)
+            if len(rows) < batch:
+                break
+            after = rows[-1].url
 
     # we need it to be this long
     def update(  # noqa: PLR0913
@@ -146,9 +338,12 @@ class Repository(db.Model):
         lint_code: int,
         lint_output: str,
         spdx_output: str,
+        protocol: str | None = None,
     ) -> None:
         """Update the database entry of a Repository"""
         self.url = url
+        if protocol is not None:
+            self.protocol = protocol
         self.hash = hash
         self.status = status
         self.lint_code = lint_code
@@ -156,3 +351,99 @@ class Repository(db.Model):
         self.spdx_output = spdx_output
         self.last_access = datetime.utcnow()
         db.session.commit()
+        compliant_projects.update(url, status == Status.OK)
+
+
+class QueuedTask(db.Model):
+    """Check of a repository that is waiting in, or claimed from, the shared
+    task queue. Rows are keyed by the lower-cased URL, so a repository can
+    only be queued once across all processes."""
+
+    __tablename__ = "task"
+
+    key: str = db.Column(db.String, primary_key=True)
+    url: str = db.Column(db.String, nullable=False)
+    protocol: str = db.Column(db.String(5), nullable=False)
+    head: str = db.Column(db.String(40), nullable=False)
+    priority: int = db.Column(db.SmallInteger, nullable=False)
+    enqueued = db.Column(db.DateTime(), nullable=False)
+    # Set while a runner works on the task. Expired leases can be claimed again.
+    owner: str = db.Column(db.String)
+    lease_until = db.Column(db.DateTime())
+    attempts: int = db.Column(db.SmallInteger, nullable=False, default=0)
+
+
+# When this process prunes the lint results next, see `LintResult.prune_if_due`
+_next_prune: float = 0
+_prune_lock = Lock()
+
+
+class LintResult(db.Model):
+    """Outcome of linting a commit. Forks and mirrors of a repository are at
+    the same commits, so they can share it instead of being linted again."""
+
+    __tablename__ = "lint_result"
+
+    hash: str = db.Column(db.String(40), primary_key=True)
+    lint_code: int = db.Column(db.SmallInteger, nullable=False)
+    lint_output_gz = orm.deferred(db.Column(db.LargeBinary))
+    spdx_output_gz = orm.deferred(db.Column(db.LargeBinary))
+    last_used = db.Column(db.DateTime(), nullable=False)
+    # Number of checks that were finished with this result
+    hits: int = db.Column(db.Integer, nullable=False, default=0)
+
+    lint_output = compressed("lint_output_gz")
+    spdx_output = compressed("spdx_output_gz")
+
+    @classmethod
+    def store(
+        cls, hash: str, lint_code: int, lint_output: str, spdx_output: str
+    ) -> None:
+        """Remember the result of linting a commit, replacing an older one"""
+        try:
+            db.session.merge(
+                cls(
+                    hash=hash,
+                    lint_code=lint_code,
+                    lint_output=lint_output,
+                    spdx_output=spdx_output,
+                    last_used=datetime.utcnow(),
+                )
+            )
+            db.session.commit()
+        except IntegrityError:
+            # Another process stored the same commit in the meantime
+            db.session.rollback()
+
+    @classmethod
+    def use(cls, hash: str) -> "LintResult | None":
+        """Fetch the result for a commit, counting it as a hit"""
+        updated = db.session.execute(
+            db.update(cls)
+            .where(cls.hash == hash)
+            .values(hits=cls.hits + 1, last_used=datetime.utcnow())
+        )
+        db.session.commit()
+        if not updated.rowcount:
+            return None
+        return db.session.get(cls, hash)
+
+    @classmethod
+    def prune(cls, max_age: timedelta) -> int:
+        """Forget results that were not used for `max_age`"""
+        deleted = db.session.execute(
+            db.delete(cls).where(cls.last_used < datetime.utcnow() - max_age)
+        )
+        db.session.commit()
+        return deleted.rowcount
+
+    @classmethod
+    def prune_if_due(cls, max_age: timedelta, interval: float = 3600) -> int:
+        """Like `prune`, but at most once every `interval` seconds per process,
+        so that it can be called after every check"""
+        global _next_prune  # noqa: PLW0603
+        with _prune_lock:
+            if monotonic() < _next_prune:
+                return 0
+            _next_prune = monotonic() + interval
+        return cls.prune(max_age)
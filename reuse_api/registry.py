@@ -0,0 +1,53 @@
+"""In-memory index of the projects registered via the `forms` app."""
+
+import json
+from os import stat
+from threading import Lock
+
+from .config import FORMS_FILE
+
+
+class RegistrationIndex:
+    """
+    Lower-cased set of all confirmed project URLs in the forms file. The file is
+    only parsed again when its inode, size or modification time changes, so a
+    lookup usually costs a single stat() call.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._signature: tuple[int, int, int] | None = None
+        self._urls: frozenset[str] = frozenset()
+        self._lock = Lock()
+
+    def __contains__(self, url: str) -> bool:
+        return url.lower() in self.urls()
+
+    def __len__(self) -> int:
+        return len(self.urls())
+
+    def urls(self) -> frozenset[str]:
+        """Return all registered URLs, reloading the file if it has changed"""
+        info = stat(self.path)
+        signature = (info.st_ino, info.st_size, info.st_mtime_ns)
+        if signature != self._signature:
+            with self._lock:
+                if signature != self._signature:
+                    self._reload(signature)
+        return self._urls
+
+    def _reload(self, signature: tuple[int, int, int]) -> None:
+        try:
+            with open(self.path) as f:
+                projects = json.load(f)
+        except json.JSONDecodeError:
+            # The forms app may be in the middle of rewriting the file. Keep
+            # the previous index and try again on the next lookup.
+            return
+        self._urls = frozenset(
+            project["include_vars"]["project"].lower() for project in projects
+        )
+        self._signature = signature
+
+
+registrations = RegistrationIndex(FORMS_FILE)
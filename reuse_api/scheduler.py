@@ -1,39 +1,101 @@
 # SPDX-FileCopyrightText: 2023 DB Systel GmbH
 
+import os
+import signal
 import subprocess
+from collections import Counter, defaultdict, deque
+from collections.abc import Iterable, Iterator
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from contextlib import suppress
+from itertools import batched
 from json import JSONDecodeError
 from queue import Empty
-from threading import Thread
-from typing import override
+from threading import Event, Thread
+from time import monotonic
+from typing import NamedTuple, override
 
-from flask import abort, current_app
+from flask import current_app
 
+from .cache import head_cache
 from .config import (
+    FLEET_CHECK_BATCH,
+    FLEET_CHECK_INTERVAL,
+    FLEET_CHECK_RATE,
+    FLEET_QUEUE_LIMIT,
+    LINT_BACKEND,
+    LINT_CACHE,
+    NB_REFRESHER,
     NB_RUNNER,
+    PROBE_PER_HOST,
+    PROBE_WORKERS,
     REUSE_API,
-    SSH_KEY_PATH,
-    SSH_KNOW_HOST_PATH,
-    SSH_PORT,
-    SSH_USER,
+    SSH_EJECT_SECONDS,
+    SSH_MULTIPLEX,
+    TASK_QUEUE,
 )
-from .models import Repository
-from .task import Task, TaskQueue
+from .local import LocalConnection, LocalWorkers
+from .metrics import (
+    LINT_DURATION,
+    PROBE_DURATION,
+    PROBE_FAILURES,
+    QUEUE_DEPTH,
+    forge,
+)
+from .models import Repository, RepositoryStatus, db
+from .ssh import Connection, WorkerPool
+from .task import DatabaseTaskQueue, Priority, RefreshQueue, Task, TaskQueue
 
 
 class InvalidRepositoryError(Exception):
     pass
 
 
-def determine_protocol(url: str) -> str:
-    """Determine the protocol."""
+class ForgeUnavailableError(InvalidRepositoryError):
+    """The forge could not tell whether the repository exists, e.g. because it
+    timed out or could not be reached"""
+
+
+# Errors of ls-remote that mean the repository does not exist, as opposed to
+# the forge failing
+MISSING_REPOSITORY: tuple[str, ...] = (
+    "not found",
+    "does not appear to be a git repository",
+    "terminal prompts disabled",
+    "returned error: 401",
+    "returned error: 404",
+)
+
+
+PROTOCOLS: tuple[str, ...] = ("https", "git", "http")
+
+
+def determine_protocol(url: str, preferred: str | None = None) -> tuple[str, str]:
+    """Determine the protocol, and return it with the latest hash it yielded.
+
+    The `preferred` protocol, usually the one that worked last time, is tried
+    first so that a known repository normally costs a single ls-remote. If
+    no protocol works, the repository is missing if any protocol got that
+    answer from the forge. Protocols that only failed, like git:// on forges
+    that refuse or no longer support it, do not count. If none got an
+    answer, ForgeUnavailableError is raised.
+    """
+    missing = False
+    protocols = PROTOCOLS
+    if preferred in PROTOCOLS:
+        protocols = (preferred, *(p for p in PROTOCOLS if p != preferred))
     # Try these protocols and use the first that works
-    try:
-        for protocol in ("https", "git", "http"):
-            latest_hash(protocol, url)
-            return protocol
-    except InvalidRepositoryError:
-        pass
-    raise InvalidRepositoryError
+    host = forge(url)
+    for protocol in protocols:
+        started = monotonic()
+        try:
+            return protocol, latest_hash(protocol, url)
+        except InvalidRepositoryError as error:
+            PROBE_FAILURES.labels(host).inc()
+            missing = missing or not isinstance(error, ForgeUnavailableError)
+            continue
+        finally:
+            PROBE_DURATION.labels(host).observe(monotonic() - started)
+    raise InvalidRepositoryError if missing else ForgeUnavailableError
 
 
 def latest_hash(protocol: str, url: str) -> str:
@@ -42,69 +104,209 @@ def latest_hash(protocol: str, url: str) -> str:
         # pylint: disable=subprocess-run-check
         result = subprocess.run(
             ["git", "ls-remote", f"{protocol}://{url}", "HEAD"],
-            stdout=subprocess.PIPE,
+            capture_output=True,
             timeout=5,
             check=False,
         )
     except subprocess.TimeoutExpired:
-        raise InvalidRepositoryError
+        raise ForgeUnavailableError
 
     if result.returncode != 0:
-        raise InvalidRepositoryError
+        error = result.stderr.decode("utf-8", errors="replace").lower()
+        if any(message in error for message in MISSING_REPOSITORY):
+            raise InvalidRepositoryError
+        raise ForgeUnavailableError
 
     return result.stdout.decode("utf-8").split()[0]
 
 
+class Probe(NamedTuple):
+    """Outcome of fetching the latest HEAD of one repository"""
+
+    url: str
+    protocol: str | None
+    hash: str | None
+    error: str | None = None
+
+
+def probe(url: str, preferred: str | None = None) -> Probe:
+    try:
+        protocol, latest = determine_protocol(url, preferred)
+    except InvalidRepositoryError:
+        return Probe(url, preferred, None, "Not a Git repository")
+    return Probe(url, protocol, latest)
+
+
+def probe_many(
+    repositories: Iterable[tuple[str, str | None]],
+    workers: int = PROBE_WORKERS,
+    per_host: int = PROBE_PER_HOST,
+) -> Iterator[Probe]:
+    """Probe many (url, preferred protocol) pairs concurrently.
+
+    At most `workers` ls-remote processes run at the same time, and at most
+    `per_host` of them against the same forge. Results are yielded in the
+    order they complete.
+    """
+    pending: dict[str, deque[tuple[str, str | None]]] = defaultdict(deque)
+    for url, protocol in repositories:
+        pending[url.split("/", maxsplit=1)[0].lower()].append((url, protocol))
+
+    running: dict[Future, str] = {}
+    active: Counter[str] = Counter()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        while pending or running:
+            for host in list(pending):
+                queue = pending[host]
+                while queue and active[host] < per_host and len(running) < workers:
+                    running[executor.submit(probe, *queue.popleft())] = host
+                    active[host] += 1
+                if not queue:
+                    del pending[host]
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                active[running.pop(future)] -= 1
+                yield future.result()
+
+
+# Return code of ssh itself failing, as opposed to the command it ran
+SSH_ERROR: int = 255
+
+# Seconds a check may take, including the retry over a new SSH connection. The
+# TASK_LEASE has to be longer.
+LINT_TIMEOUT: int = 900
+
+
+def _signal_group(process: subprocess.Popen, signum: int) -> None:
+    """Send the signal to the process and everything it started, which run in
+    a session of their own"""
+    with suppress(ProcessLookupError):
+        os.killpg(process.pid, signum)
+
+
+# Where the runners of the process lint, shared by all of them
+workers: WorkerPool | LocalWorkers = (
+    LocalWorkers(NB_RUNNER)
+    if LINT_BACKEND == "local"
+    else WorkerPool.parse(REUSE_API, NB_RUNNER)
+)
+
+
 class Runner(Thread):
     """Defining one task in the schedule queue"""
 
     def __init__(self, queue, app):
         self._queue = queue
         self._app = app
+        self._workers = workers
+        self._process: subprocess.Popen | None = None
         self.__running: bool = False
-        super().__init__()
+        # Daemon, so that interpreter shutdown reaches the atexit handler that
+        # stops the runners instead of waiting for them
+        super().__init__(daemon=True)
+
+    def _execute(self, cmd: list[str], timeout: float) -> subprocess.CompletedProcess:
+        """Like subprocess.run, but stop() can terminate the process.
+
+        The process and its children, like the clone and lint of a local
+        check, are stopped together. They are terminated first so that they
+        can clean up, and killed if they do not exit on a timeout.
+        """
+        with subprocess.Popen(
+            cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, start_new_session=True
+        ) as process:
+            self._process = process
+            if not self.__running:
+                _signal_group(process, signal.SIGTERM)
+            try:
+                stdout, stderr = process.communicate(timeout=timeout)
+            except subprocess.TimeoutExpired:
+                _signal_group(process, signal.SIGTERM)
+                try:
+                    process.communicate(timeout=5)
+                finally:
+                    _signal_group(process, signal.SIGKILL)
+                raise
+            finally:
+                self._process = None
+        return subprocess.CompletedProcess(cmd, process.returncode, stdout, stderr)
+
+    def _lint(
+        self, task: Task, connection: Connection | LocalConnection
+    ) -> subprocess.CompletedProcess:
+        """Lint the repository on the worker host over SSH, or locally, within
+        LINT_TIMEOUT seconds"""
+        deadline = monotonic() + LINT_TIMEOUT
+        cmd: list[str] = connection.lint_command(task.protocol, task.url)
+        connection.connect()
+        result = self._execute(cmd, deadline - monotonic())
+        if result.returncode == SSH_ERROR and SSH_MULTIPLEX and self.__running:
+            # The master connection may have gone stale. Retry once over a
+            # new one before treating it as a failure, in the time that is
+            # left so that the check does not outlive its lease.
+            self._app.logger.info("reconnecting to %s", connection.host)
+            connection.reset()
+            connection.connect()
+            if (remaining := deadline - monotonic()) <= 0:
+                raise subprocess.TimeoutExpired(cmd, LINT_TIMEOUT)
+            result = self._execute(cmd, remaining)
+        return result
+
+    def _save(self, task: Task, result: subprocess.CompletedProcess) -> bool:
+        """Store the result in the database, and return whether it was valid"""
+        output: str = result.stdout.decode("utf-8")
+        if not output:  # Check if output is not empty
+            self._app.logger.warning(
+                "No output from linting command for url %s",
+                task.url,
+            )
+
+        try:  # Update database entry with the results of this check
+            with self._app.app_context():  # Needed for the database session
+                task.update_db(output)
+
+        except JSONDecodeError as e:
+            self._app.logger.error("Failed to parse JSON output: %s", e)
+            return False
+        return True
+
+    def _release(
+        self, connection: Connection | LocalConnection, failed: bool | None
+    ) -> None:
+        if self._workers.release(connection, failed):
+            self._app.logger.warning(
+                "Lint worker %s keeps failing, not using it for %ds",
+                connection.host,
+                SSH_EJECT_SECONDS,
+            )
 
     @override
     def run(self):
         self.__running = True
         while self.__running:
+            # Reserve a worker host before taking a task, so that tasks stay
+            # in the queue while all hosts are busy or ejected. The timeouts
+            # allow the thread to check whether it is still supposed to be
+            # running every X seconds.
+            connection = self._workers.acquire(timeout=5)
+            if connection is None:
+                continue
             try:
-                # The timeout allows the thread to check whether it is still
-                # supposed to be running every X seconds.
                 task = self._queue.get(timeout=5)
             except Empty:
+                self._release(connection, None)
                 continue
 
-            self._app.logger.debug("linting '%s'", task.url)
+            self._app.logger.debug("linting '%s' on %s", task.url, connection.host)
+            interrupted: bool = False
+            failed: bool | None = None
+            outcome: str = "success"
+            started = monotonic()
             try:
-                cmd: list[str] = [
-                    "ssh",
-                    # SSH private key
-                    "-i",
-                    SSH_KEY_PATH,
-                    # accept new host keys, define known_hosts file
-                    "-o",
-                    "StrictHostKeyChecking=accept-new",
-                    "-o",
-                    f"UserKnownHostsFile={SSH_KNOW_HOST_PATH}",
-                    # SSH host (API worker), and its port
-                    f"{SSH_USER}@{REUSE_API}",
-                    "-p",
-                    str(SSH_PORT),
-                    # Command with args (repo URL, verbosity)
-                    "reuse_lint_repo",
-                    "-r",
-                    f"{task.protocol}://{task.url}",
-                    "-v",
-                ]
-                # pylint: disable=subprocess-run-check
-                result = subprocess.run(
-                    cmd,
-                    capture_output=True,
-                    timeout=900,
-                    check=False,
-                )
+                result = self._lint(task, connection)
             except subprocess.TimeoutExpired:
+                outcome = "timeout"
                 self._app.logger.warning("linting of '%s' timed out", task.url)
             else:
                 self._app.logger.debug(
@@ -116,35 +318,150 @@ class Runner(Thread):
                 # assume that the SSH connection failed. In this case, we do
                 # not update the repository, neither the hash nor the status.
                 # Instead, we write a warning that should be monitored.
-                error_code: int = 255
-                if result.returncode == error_code:
+                if interrupted := (not self.__running and result.returncode < 0):
+                    # Stopped during shutdown, another runner will do it
+                    outcome = "interrupted"
+                    self._app.logger.info("handing back '%s'", task.url)
+                elif failed := result.returncode == SSH_ERROR:
+                    outcome = "ssh_error"
                     self._app.logger.warning(
-                        "SSH connection failed when checking '%s'. Not "
+                        "SSH connection to %s failed when checking '%s'. Not "
                         "updating database. STDERR was: %s",
+                        connection.host,
                         task.url,
                         result.stderr.decode("UTF-8"),
                     )
-                else:
-                    output: str = result.stdout.decode("utf-8")
-                    if not output:  # Check if output is not empty
-                        self._app.logger.warning(
-                            "No output from linting command for url %s",
-                            task.url,
-                        )
-
-                    try:  # Update database entry with the results of this check
-                        with self._app.app_context():  # Needed for the database session
-                            task.update_db(output)
-
-                    except JSONDecodeError as e:
-                        self._app.logger.error("Failed to parse JSON output: %s", e)
+                elif not self._save(task, result):
+                    outcome = "json_error"
             finally:
-                self._queue.done(task)
+                LINT_DURATION.labels(outcome).observe(monotonic() - started)
+                self._release(connection, failed)
+                if interrupted:
+                    self._queue.release(task)
+                else:
+                    self._queue.done(task)
+
+    def stop(self) -> None:
+        """Stop taking tasks, and terminate the one currently being linted"""
+        self.__running = False
+        if (process := self._process) is not None:
+            _signal_group(process, signal.SIGTERM)
 
     @override
     def join(self, timeout=None) -> None:
+        self.stop()
+        super().join(timeout)
+
+
+class Refresher(Thread):
+    """Fetches the latest HEAD of repositories in the background"""
+
+    def __init__(self, queue, scheduler, app):
+        self._queue = queue
+        self._scheduler = scheduler
+        self._app = app
+        self.__running: bool = False
+        super().__init__(daemon=True)
+
+    @override
+    def run(self):
+        self.__running = True
+        while self.__running:
+            try:
+                url, record, force = self._queue.get(timeout=5)
+            except Empty:
+                continue
+
+            # A failing repository, e.g. because of a database error, must not
+            # end the thread. The URL is no longer pending, so it is refreshed
+            # again when it is requested the next time.
+            try:
+                self._scheduler.refresh(url, record, force)
+            except Exception:
+                self._app.logger.exception("Failed to refresh %s", url)
+
+    def stop(self) -> None:
+        self.__running = False
+
+    @override
+    def join(self, timeout=None) -> None:
+        self.stop()
+        super().join(timeout)
+
+
+class FleetChecker(Thread):
+    """Periodically refreshes the HEADs of all repositories, least recently
+    checked first, and enqueues those that are outdated.
+
+    To leave room for interactive requests, it probes at most
+    FLEET_CHECK_RATE repositories per second, and waits while the check queue
+    holds FLEET_QUEUE_LIMIT tasks or more. A trigger during a run does not
+    speed it up, but starts another run once it is finished.
+
+    Every process has its own fleet checker, so a trigger only reaches the one
+    of the process that received it.
+    """
+
+    def __init__(self, queue, scheduler, app, interval: int = FLEET_CHECK_INTERVAL):
+        self._queue = queue
+        self._scheduler = scheduler
+        self._app = app
+        self._interval = interval
+        self._wakeup = Event()
+        self._stopped = Event()
+        self._force: bool = False
+        self.__running: bool = False
+        super().__init__(daemon=True)
+
+    def trigger(self, force: bool = False) -> None:
+        """Start a run now instead of waiting for the interval to pass"""
+        self._force = self._force or force
+        self._wakeup.set()
+
+    @override
+    def run(self):
+        self.__running = True
+        while self.__running:
+            # Without an interval, only run when triggered
+            self._wakeup.wait(timeout=self._interval or None)
+            self._wakeup.clear()
+            if not self.__running:
+                break
+            force, self._force = self._force, False
+            self.check_all(force)
+
+    def check_all(self, force: bool = False) -> None:
+        self._app.logger.info("Checking all repositories (force: %s)", force)
+        checked = 0
+        with self._app.app_context():
+            records = Repository.least_recently_checked(FLEET_CHECK_BATCH)
+            for batch in batched(records, FLEET_CHECK_BATCH):
+                # End the transaction of the page query. A run takes hours,
+                # and an open transaction keeps PostgreSQL from vacuuming.
+                db.session.commit()
+                while self.__running and len(self._queue) >= FLEET_QUEUE_LIMIT:
+                    self._stopped.wait(timeout=5)
+                if not self.__running:
+                    return
+
+                started = monotonic()
+                for _ in self._scheduler.refresh_many(batch, force):
+                    checked += 1
+                # Stay within the rate budget
+                budget = len(batch) / FLEET_CHECK_RATE - (monotonic() - started)
+                if budget > 0:
+                    self._stopped.wait(timeout=budget)
+        self._app.logger.info("Checked %d repositories", checked)
+
+    def stop(self) -> None:
         self.__running = False
-        super().join()
+        self._stopped.set()
+        self._wakeup.set()
+
+    @override
+    def join(self, timeout=None) -> None:
+        self.stop()
+        super().join(timeout)
 
 
 class Scheduler:
@@ -155,30 +472,92 @@ class Scheduler:
 
     In essence, this is just a container class to hold a queue and some
     runners, and to provide some convenience functions to manage them both.
+
+    Without `runners`, the scheduler only fills the queue, and the periodic
+    fleet check is left to the worker processes that do run them.
     """
 
-    def __init__(self, app):
+    def __init__(self, app, runners: bool = True):
         self._app = app
-        self._queue = TaskQueue()
-        self._runners = [Runner(self._queue, self._app) for _ in range(NB_RUNNER)]
+        self._queue = (
+            DatabaseTaskQueue(app) if TASK_QUEUE == "database" else TaskQueue()
+        )
+        self._runners = [
+            Runner(self._queue, self._app) for _ in range(NB_RUNNER if runners else 0)
+        ]
+        self._refresh_queue = RefreshQueue()
+        self._refreshers = [
+            Refresher(self._refresh_queue, self, self._app) for _ in range(NB_REFRESHER)
+        ]
+        self._fleet_checker = FleetChecker(
+            self._queue, self, self._app, FLEET_CHECK_INTERVAL if runners else 0
+        )
         self.__running: bool = False
 
-    def __add_task(self, task: Task) -> None:
+    def __add_task(self, task: Task, priority: Priority) -> None:
         """Add a repository to the check queue"""
         if not self.__running:
-            current_app.logger.warning(
+            self._app.logger.warning(
                 "cannot add task to queue when scheduler is not running"
             )
             return False
 
         if task in self._queue:
-            current_app.logger.debug("Task already enqueued: %s", task.url)
+            self._app.logger.debug("Task already enqueued: %s", task.url)
             return False
 
-        current_app.logger.info("Task enqueued: %s", task.url)
-        self._queue.put_nowait(task)
+        self._app.logger.info("Task enqueued: %s (%s)", task.url, priority.name)
+        self._queue.put_nowait(task, priority)
 
-        current_app.logger.debug("Queue size: %d", len(self._queue))
+        self._app.logger.debug("Queue size: %d", len(self._queue))
+        return True
+
+    def __check(
+        self, task: Task, known_hash: str | None, force: bool, bulk: bool = False
+    ) -> None:
+        """Enqueue the task if the stored result is outdated or forced"""
+        if bulk:
+            priority = Priority.BULK
+        elif known_hash is None:
+            priority = Priority.NEW
+        else:
+            priority = Priority.OUTDATED
+
+        if task in self._queue:
+            self._app.logger.debug("Task enqueued: %s", task.url)
+
+        elif force:
+            self._app.logger.debug("Forcefully scheduling %s", task.url)
+            self.__add_task(task, priority)
+
+        elif known_hash != task.head:
+            # Make the database entry up-to-date.
+            self._app.logger.debug("Repo outdated: %s", task.url)
+            if not self.__reuse_result(task):
+                self.__add_task(task, priority)
+        else:
+            self._app.logger.debug("Repo up-to-date: %s", task.url)
+
+    def report_queue_depth(self) -> None:
+        """Update the queue depth metric of a queue in the database. A queue in
+        memory keeps it up to date by itself."""
+        if isinstance(self._queue, DatabaseTaskQueue):
+            for lane, depth in self._queue.depths().items():
+                QUEUE_DEPTH.labels(lane).set(depth)
+
+    def pending(self) -> int:
+        """Number of checks that are waiting or being run"""
+        return len(self._queue)
+
+    def __reuse_result(self, task: Task) -> bool:
+        """Finish the task with the result of an earlier check of its commit,
+        e.g. of a fork or mirror. Forced checks never get here."""
+        if not LINT_CACHE:
+            return False
+        with self._app.app_context():
+            if not task.update_from_cache():
+                return False
+        self._app.logger.info("Commit already checked: %s (%s)", task.url, task.head)
         return True
 
     def run(self) -> None:
@@ -186,50 +565,116 @@ class Scheduler:
         self.__running = True
         for runner in self._runners:
             runner.start()
+        for refresher in self._refreshers:
+            refresher.start()
+        self._fleet_checker.start()
 
     def join(self) -> None:
-        self._app.logger.debug("finishing the queue")
-        self._queue.join()
+        """Stop all threads without waiting for the queue to be finished.
+
+        Tasks that are being linted are handed back to the queue. With the
+        database queue, they and all waiting tasks are picked up again after
+        a restart. The memory queue loses them.
+        """
+        if not self.__running:
+            return
         self._app.logger.debug("stopping all threads")
         self.__running = False
-        for runner in self._runners:
-            runner.join()
+        threads = [self._fleet_checker, *self._runners, *self._refreshers]
+        for thread in threads:
+            thread.stop()
+        for thread in threads:
+            thread.join()
+        if isinstance(self._queue, TaskQueue) and (pending := len(self._queue)):
+            self._app.logger.warning("dropping %d enqueued tasks", pending)
         self._app.logger.debug("finished stopping all threads")
 
-    def schedule(self, url: str, force: bool = False) -> Repository | None:
-        """Check whether repo has a new commit and execute check accordingly"""
-        current_app.logger.debug("Scheduling %s", url)
-        protocol, latest = None, None
+    def refresh(self, url: str, record: RepositoryStatus, force: bool = False) -> None:
+        """Fetch the latest HEAD of a repository and check it if it changed.
 
+        This blocks on the forge, so it is run by the Refresher threads.
+        """
+        self._app.logger.debug("Refreshing HEAD of %s", url)
         try:
-            protocol = determine_protocol(url)
-            # TODO: This is an additional request that also happens inside of
-            # determine_protocol.
-            latest = latest_hash(protocol, url)
+            protocol, latest = determine_protocol(url, preferred=record.protocol)
         except InvalidRepositoryError:
-            abort(400, "Not a Git repository")
+            self._app.logger.warning("Not a Git repository: %s", url)
+            return
+
+        if protocol != record.protocol:
+            self._app.logger.debug("Protocol of %s is %s", url, protocol)
+            with self._app.app_context():
+                Repository.set_protocol(url, protocol)
+
+        head_cache.put(url.lower(), (protocol, latest))
+        self.__check(Task(protocol, url, latest), record.hash, force)
+
+    def check_all(self, force: bool = False) -> None:
+        """Let the fleet checker go through all repositories now"""
+        self._fleet_checker.trigger(force)
+
+    def refresh_many(
+        self, records: Iterable[RepositoryStatus], force: bool = False
+    ) -> Iterator[Probe]:
+        """Refresh the HEADs of many repositories at once, see `probe_many`.
+
+        Outdated repositories are enqueued for a check like in `refresh`. The
+        probe results are yielded so that callers can report on them.
+        """
+        known: dict[str, RepositoryStatus] = {}
+
+        def repositories() -> Iterator[tuple[str, str | None]]:
+            for record in records:
+                known[record.url.lower()] = record
+                yield record.url, record.protocol
+
+        for result in probe_many(repositories()):
+            record = known[result.url.lower()]
+            if result.error:
+                self._app.logger.warning("%s: %s", result.error, result.url)
+                yield result
+                continue
 
-        repository = Repository.find(url)
-        task_of_repository = Task(protocol, url, latest)
+            if result.protocol != record.protocol:
+                with self._app.app_context():
+                    Repository.set_protocol(result.url, result.protocol)
+            head_cache.put(result.url.lower(), (result.protocol, result.hash))
+            self.__check(
+                Task(result.protocol, result.url, result.hash),
+                record.hash,
+                force,
+                bulk=True,
+            )
+            yield result
+
+    def schedule(
+        self, url: str, force: bool = False, record: RepositoryStatus | None = None
+    ) -> RepositoryStatus | None:
+        """Check whether repo has a new commit and execute check accordingly.
+
+        This never waits for the forge: if the cached HEAD of the repository is
+        missing or stale, it is refreshed in the background and the stored
+        record is returned right away. Callers that already looked up the
+        repository can pass its `record` to avoid querying the database again.
+        """
+        current_app.logger.debug("Scheduling %s", url)
+
+        if record is None:
+            record = Repository.lookup(url)
 
-        if repository is None:
+        if record is None:
             # Create a new entry.
             current_app.logger.debug("No database entry found: %s", url)
             repository = Repository.create(url=url)
-            if repository:
-                self.__add_task(task_of_repository)
-        elif task_of_repository in self._queue:
-            current_app.logger.debug("Task enqueued: %s", url)
+            if repository is None:
+                return None
+            record = RepositoryStatus.from_row(repository)
 
-        elif force:
-            current_app.logger.debug("Forcefully scheduling %s", url)
-            self.__add_task(task_of_repository)
-
-        elif repository.hash != latest:
-            # Make the database entry up-to-date.
-            current_app.logger.debug("Repo outdated: %s", url)
-            self.__add_task(task_of_repository)
+        head = head_cache.get(url.lower())
+        if force or head is None:
+            self._refresh_queue.request(url, record, force)
         else:
-            current_app.logger.debug("Repo up-to-date: %s", url)
+            protocol, latest = head
+            self.__check(Task(protocol, url, latest), record.hash, force)
 
-        return repository
+        return record
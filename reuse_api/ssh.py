@@ -0,0 +1,178 @@
+"""SSH connections to the lint worker hosts."""
+
+import subprocess
+from threading import Condition, Lock
+from time import monotonic
+
+from .config import (
+    SSH_CONTROL_PATH,
+    SSH_CONTROL_PERSIST,
+    SSH_EJECT_AFTER,
+    SSH_EJECT_SECONDS,
+    SSH_KEY_PATH,
+    SSH_KNOW_HOST_PATH,
+    SSH_MULTIPLEX,
+    SSH_PORT,
+    SSH_USER,
+)
+
+
+class Connection:
+    """
+    SSH connection to one lint worker host.
+
+    With SSH_MULTIPLEX, all lint commands share one master connection per
+    host instead of each doing a full key exchange and authentication. The
+    master is started on demand, checked before use, and restarted when a
+    command fails with SSH's error code 255.
+    """
+
+    def __init__(self, host: str):
+        self.host = host
+        self._lock = Lock()
+
+    @property
+    def destination(self) -> str:
+        return f"{SSH_USER}@{self.host}"
+
+    def ssh(self, *args: str) -> list[str]:
+        """Build an ssh command line with the common options"""
+        cmd: list[str] = [
+            "ssh",
+            # SSH private key
+            "-i",
+            SSH_KEY_PATH,
+            # accept new host keys, define known_hosts file
+            "-o",
+            "StrictHostKeyChecking=accept-new",
+            "-o",
+            f"UserKnownHostsFile={SSH_KNOW_HOST_PATH}",
+            # port of the SSH host (API worker)
+            "-p",
+            str(SSH_PORT),
+        ]
+        if SSH_MULTIPLEX:
+            # Use the master connection if there is one, else connect directly
+            cmd += ["-o", f"ControlPath={SSH_CONTROL_PATH}"]
+        return [*cmd, *args]
+
+    def lint_command(self, protocol: str, url: str) -> list[str]:
+        # Command with args (repo URL, verbosity)
+        return self.ssh(
+            self.destination, "reuse_lint_repo", "-r", f"{protocol}://{url}", "-v"
+        )
+
+    def _control(self, *args: str, timeout: int = 10) -> bool:
+        try:
+            result = subprocess.run(
+                self.ssh(*args, self.destination),
+                stdin=subprocess.DEVNULL,
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+                timeout=timeout,
+                check=False,
+            )
+        except subprocess.TimeoutExpired:
+            return False
+        return result.returncode == 0
+
+    def is_alive(self) -> bool:
+        """Check whether the master connection is up"""
+        return SSH_MULTIPLEX and self._control("-O", "check")
+
+    def connect(self) -> bool:
+        """Start the master connection unless it is already up"""
+        if not SSH_MULTIPLEX:
+            return False
+        with self._lock:
+            if self.is_alive():
+                return True
+            # -f backgrounds the master once it is authenticated. Its output
+            # goes to /dev/null, so it does not keep any of our pipes open.
+            return self._control(
+                "-M",
+                "-N",
+                "-f",
+                "-o",
+                f"ControlPersist={SSH_CONTROL_PERSIST}",
+                timeout=30,
+            )
+
+    def reset(self) -> None:
+        """Tear down the master connection, e.g. after it broke"""
+        if SSH_MULTIPLEX:
+            with self._lock:
+                self._control("-O", "exit")
+
+
+class WorkerPool:
+    """
+    Lint worker hosts, each with a limit of concurrent checks.
+
+    Checks go to the least loaded healthy host. A host whose SSH connection
+    fails SSH_EJECT_AFTER times in a row is ejected for SSH_EJECT_SECONDS,
+    after which it gets another chance.
+    """
+
+    def __init__(self, hosts: dict[str, int]):
+        self._connections = {host: Connection(host) for host in hosts}
+        self._limits = hosts
+        self._active: dict[str, int] = dict.fromkeys(hosts, 0)
+        self._failures: dict[str, int] = dict.fromkeys(hosts, 0)
+        self._ejected_until: dict[str, float] = dict.fromkeys(hosts, 0.0)
+        self._available = Condition()
+
+    @classmethod
+    def parse(cls, spec: str, default_limit: int) -> "WorkerPool":
+        """Create a pool from a comma-separated list of `host` or `host=limit`"""
+        hosts: dict[str, int] = {}
+        for entry in spec.split(","):
+            host, _, limit = entry.strip().partition("=")
+            if host:
+                hosts[host] = int(limit) if limit else default_limit
+        return cls(hosts)
+
+    def _pick(self) -> str | None:
+        now = monotonic()
+        candidates = [
+            host
+            for host, limit in self._limits.items()
+            if self._active[host] < limit and self._ejected_until[host] <= now
+        ]
+        if not candidates:
+            return None
+        return min(candidates, key=lambda h: self._active[h] / self._limits[h])
+
+    def acquire(self, timeout: float) -> Connection | None:
+        """Reserve a slot on the least loaded healthy host, or return None if
+        there is none within `timeout` seconds"""
+        with self._available:
+            if not self._available.wait_for(self._pick, timeout=timeout):
+                return None
+            host = self._pick()
+            self._active[host] += 1
+            return self._connections[host]
+
+    def release(self, connection: Connection, failed: bool | None = None) -> bool:
+        """
+        Free the slot. `failed` tells whether the SSH connection failed, and is
+        None if the host was not used. Return whether the host got ejected.
+        """
+        host = connection.host
+        ejected = False
+        with self._available:
+            self._active[host] -= 1
+            if failed:
+                self._failures[host] += 1
+                if ejected := self._failures[host] >= SSH_EJECT_AFTER:
+                    self._failures[host] = 0
+                    self._ejected_until[host] = monotonic() + SSH_EJECT_SECONDS
+            elif failed is not None:
+                self._failures[host] = 0
+            self._available.notify_all()
+        return ejected
+
+    def load(self) -> dict[str, int]:
+        """Number of checks running on each host"""
+        with self._available:
+            return dict(self._active)
@@ -1,11 +1,35 @@
+from collections import deque
+from datetime import datetime, timedelta
+from enum import IntEnum
 from json import loads as json_loads
-from queue import Queue
+from os import getpid
+from queue import Empty, Queue
+from socket import gethostname
 from threading import Lock
+from time import monotonic, sleep
 from typing import NamedTuple, override
 
-from reuse_api import models as db
+from flask import current_app
+from sqlalchemy.exc import IntegrityError
 
-from .models import Repository
+from .cache import badge_cache
+from .config import (
+    LINT_CACHE_DAYS,
+    NB_RUNNER,
+    QUEUE_STARVATION_LIMIT,
+    TASK_LEASE,
+    TASK_MAX_ATTEMPTS,
+    TASK_POLL_INTERVAL,
+)
+from .metrics import LINT_CACHE_HITS, QUEUE_DEPTH, QUEUE_WAIT
+from .models import (
+    LintResult,
+    QueuedTask,
+    Repository,
+    RepositoryStatus,
+    Status,
+    db,
+)
 
 
 class Task(NamedTuple):
@@ -19,24 +43,73 @@ class Task(NamedTuple):
         # Output is JSON, convert to dict
         output = json_loads(output)
 
+        self.save(output["exit_code"], output["lint_output"], output["spdx_output"])
+        LintResult.store(
+            self.head,
+            output["exit_code"],
+            output["lint_output"],
+            output["spdx_output"],
+        )
+        if pruned := LintResult.prune_if_due(timedelta(days=LINT_CACHE_DAYS)):
+            current_app.logger.info("Removed %d unused lint results", pruned)
+
+    def update_from_cache(self) -> bool:
+        """Update the repository with the result of an earlier check of the
+        same commit, if there is one"""
+        result = LintResult.use(self.head)
+        if result is None:
+            return False
+        LINT_CACHE_HITS.inc()
+        self.save(result.lint_code, result.lint_output, result.spdx_output)
+        return True
+
+    def save(self, lint_code: int, lint_output: str, spdx_output: str) -> None:
         # Here, we update the URL as well, since it could differ in case from
         # what's stored previously, and we want the info pages to display the URL
         # in the form it was used for the last check.
         Repository.find(self.url).update(
             url=self.url,
             hash=self.head,
-            status=(db.Status.OK if output["exit_code"] == 0 else db.Status.BAD),
-            lint_code=output["exit_code"],
-            lint_output=output["lint_output"],
-            spdx_output=output["spdx_output"],
+            status=(Status.OK if lint_code == 0 else Status.BAD),
+            lint_code=lint_code,
+            lint_output=lint_output,
+            spdx_output=spdx_output,
+            protocol=self.protocol,
         )
+        badge_cache.discard(self.url.lower())
+
+
+class Priority(IntEnum):
+    """Lanes of the TaskQueue, served in this order"""
+
+    NEW = 0  # First check of a freshly registered repository
+    OUTDATED = 1  # Repository with new commits, noticed by a user's request
+    BULK = 2  # Background and admin checks of many repositories
+
+
+def choose_lane(waiting: list[Priority], passed_over: list[int]) -> Priority:
+    """Pick the lane to serve next out of the `waiting` ones.
+
+    `passed_over` counts, per lane, how often in a row it was not served while
+    it had tasks waiting, and is updated accordingly.
+    """
+    starved = [p for p in waiting if passed_over[p] >= QUEUE_STARVATION_LIMIT]
+    served = starved[-1] if starved else waiting[0]
+    for priority in waiting:
+        passed_over[priority] += 1
+    passed_over[served] = 0
+    return served
 
 
 class TaskQueue(Queue):
     # Not SimpleQueue because we want .join()
     """
     Allows to know when a Task is already in the Queue or in computation to
-    limit redundant execution
+    limit redundant execution.
+
+    Tasks are served by priority. So that bulk work keeps moving, a waiting
+    lane that was passed over QUEUE_STARVATION_LIMIT times in a row is served
+    next regardless of its priority.
     """
 
     _instance = None
@@ -59,12 +132,261 @@ class TaskQueue(Queue):
             return len(self.__urls)
 
     @override
-    def put_nowait(self, task: Task) -> None:
+    def _init(self, maxsize: int) -> None:
+        # Tasks with the time they were enqueued
+        self._lanes: list[deque[tuple[float, Task]]] = [deque() for _ in Priority]
+        self._passed_over: list[int] = [0 for _ in Priority]
+
+    @override
+    def _qsize(self) -> int:
+        return sum(len(lane) for lane in self._lanes)
+
+    @override
+    def _put(self, item: tuple[Priority, Task]) -> None:
+        priority, task = item
+        self._lanes[priority].append((monotonic(), task))
+        QUEUE_DEPTH.labels(priority.name.lower()).inc()
+
+    @override
+    def _get(self) -> Task:
+        waiting = [priority for priority in Priority if self._lanes[priority]]
+        lane = choose_lane(waiting, self._passed_over)
+        enqueued, task = self._lanes[lane].popleft()
+        QUEUE_DEPTH.labels(lane.name.lower()).dec()
+        QUEUE_WAIT.labels(lane.name.lower()).observe(monotonic() - enqueued)
+        return task
+
+    @override
+    def put_nowait(self, task: Task, priority: Priority = Priority.BULK) -> None:
         with self.__urls_lock:
             self.__urls.add(task.url)
-        super().put_nowait(task)
+        super().put_nowait((priority, task))
 
     def done(self, task: Task) -> None:
         with self.__urls_lock:
             self.__urls.discard(task.url)
         super().task_done()
+
+    def release(self, task: Task) -> None:
+        """Give up on a task during shutdown. It is lost with the process."""
+        self.done(task)
+
+
+# Key of the PostgreSQL advisory lock that serializes claims of tasks
+CLAIM_LOCK: int = 0x72657573650001
+
+
+class DatabaseTaskQueue:
+    """
+    TaskQueue that lives in the `task` table, so that all processes share it.
+    Deduplication relies on the primary key, and a runner has to claim a task
+    before working on it. At most NB_RUNNER tasks are claimed at any time.
+
+    Claims are leases that expire after TASK_LEASE seconds. A task whose runner
+    died is therefore picked up again by another one, unless it was already
+    claimed TASK_MAX_ATTEMPTS times.
+    """
+
+    def __init__(self, app):
+        self._app = app
+        self._owner: str = f"{gethostname()}:{getpid()}"
+        self._passed_over: list[int] = [0 for _ in Priority]
+        self._lock: Lock = Lock()
+
+    def __contains__(self, task: Task) -> bool:
+        with self._app.app_context():
+            return db.session.get(QueuedTask, task.url.lower()) is not None
+
+    def __len__(self) -> int:
+        """Return the number of tasks in the queue"""
+        with self._app.app_context():
+            return db.session.execute(
+                db.select(db.func.count()).select_from(QueuedTask)
+            ).scalar_one()
+
+    def depths(self) -> dict[str, int]:
+        """Return the number of unclaimed tasks by lane"""
+        now = datetime.utcnow()
+        with self._app.app_context():
+            counts = dict(
+                db.session.execute(
+                    db.select(QueuedTask.priority, db.func.count())
+                    .where(
+                        db.or_(
+                            QueuedTask.lease_until.is_(None),
+                            QueuedTask.lease_until < now,
+                        )
+                    )
+                    .group_by(QueuedTask.priority)
+                ).all()
+            )
+        return {p.name.lower(): counts.get(p, 0) for p in Priority}
+
+    def put_nowait(self, task: Task, priority: Priority = Priority.BULK) -> None:
+        with self._app.app_context():
+            db.session.add(
+                QueuedTask(
+                    key=task.url.lower(),
+                    url=task.url,
+                    protocol=task.protocol,
+                    head=task.head,
+                    priority=priority,
+                    enqueued=datetime.utcnow(),
+                )
+            )
+            try:
+                db.session.commit()
+            except IntegrityError:
+                # Another process enqueued the repository in the meantime
+                db.session.rollback()
+
+    def get(self, timeout: float) -> Task:
+        """Claim the next task, waiting up to `timeout` seconds, or raise Empty"""
+        deadline = monotonic() + timeout
+        while True:
+            with self._app.app_context():
+                task = self._claim()
+            if task is not None:
+                return task
+            if monotonic() >= deadline:
+                raise Empty
+            sleep(min(TASK_POLL_INTERVAL, max(deadline - monotonic(), 0)))
+
+    def _claim(self) -> Task | None:
+        now = datetime.utcnow()
+        claimable = db.or_(
+            QueuedTask.lease_until.is_(None), QueuedTask.lease_until < now
+        )
+        # Drop tasks whose runners keep dying on them
+        dropped = db.session.execute(
+            db.delete(QueuedTask).where(
+                claimable, QueuedTask.attempts >= TASK_MAX_ATTEMPTS
+            )
+        ).rowcount
+        if dropped:
+            db.session.commit()
+            self._app.logger.error("dropped %d tasks after too many attempts", dropped)
+
+        waiting = db.session.execute(
+            db.select(QueuedTask.priority).where(claimable).distinct()
+        ).scalars()
+        waiting = sorted(Priority(priority) for priority in waiting)
+        if not waiting:
+            return None
+        with self._lock:
+            lane = choose_lane(waiting, self._passed_over)
+
+        # From here until the commit, no other process claims a task, so the
+        # count of claimed tasks below stays valid until this claim is stored
+        self._serialize_claims()
+        row = db.session.execute(
+            db.select(QueuedTask)
+            .where(claimable, QueuedTask.priority == lane)
+            .order_by(QueuedTask.enqueued)
+            .limit(1)
+            .with_for_update(skip_locked=True)
+        ).scalar_one_or_none()
+        if row is None:
+            db.session.commit()
+            return None
+
+        claimed = db.session.execute(
+            db.update(QueuedTask)
+            .where(
+                QueuedTask.key == row.key,
+                claimable,
+                # Concurrency limit across all processes
+                db.select(db.func.count())
+                .select_from(QueuedTask)
+                .where(QueuedTask.lease_until >= now)
+                .scalar_subquery()
+                < NB_RUNNER,
+            )
+            .values(
+                owner=self._owner,
+                lease_until=now + timedelta(seconds=TASK_LEASE),
+                attempts=QueuedTask.attempts + 1,
+            )
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        db.session.commit()
+        # Another runner was faster, or the concurrency limit is reached
+        if claimed != 1:
+            return None
+        QUEUE_WAIT.labels(lane.name.lower()).observe(
+            (now - row.enqueued).total_seconds()
+        )
+        return Task(row.protocol, row.url, row.head)
+
+    @staticmethod
+    def _serialize_claims() -> None:
+        """
+        Take the claim lock until the end of the transaction. SQLite runs one
+        writing statement at a time anyway, but with PostgreSQL's READ
+        COMMITTED, concurrent claimers would all count the same claimed tasks
+        and together exceed NB_RUNNER.
+        """
+        if db.session.get_bind().dialect.name == "postgresql":
+            db.session.execute(
+                db.text("SELECT pg_advisory_xact_lock(:key)"), {"key": CLAIM_LOCK}
+            )
+
+    def done(self, task: Task) -> None:
+        with self._app.app_context():
+            db.session.execute(
+                db.delete(QueuedTask).where(
+                    QueuedTask.key == task.url.lower(),
+                    QueuedTask.owner == self._owner,
+                )
+            )
+            db.session.commit()
+
+    def release(self, task: Task) -> None:
+        """Hand a claimed task back so that any runner can claim it again"""
+        with self._app.app_context():
+            db.session.execute(
+                db.update(QueuedTask)
+                .where(
+                    QueuedTask.key == task.url.lower(),
+                    QueuedTask.owner == self._owner,
+                )
+                # An interrupted run does not count as an attempt
+                .values(owner=None, lease_until=None, attempts=QueuedTask.attempts - 1)
+            )
+            db.session.commit()
+
+    def join(self) -> None:
+        """Tasks are kept in the database, so there is nothing to wait for"""
+
+
+class RefreshQueue:
+    """
+    Queue of repositories whose latest HEAD should be fetched again. A URL is
+    only queued once; requesting it again while it is pending merges both
+    requests, so a forced refresh is never lost.
+    """
+
+    def __init__(self):
+        self.__queue: Queue[str] = Queue()
+        self.__pending: dict[str, tuple[str, RepositoryStatus, bool]] = {}
+        self.__lock: Lock = Lock()
+
+    def __len__(self) -> int:
+        with self.__lock:
+            return len(self.__pending)
+
+    def request(self, url: str, record: RepositoryStatus, force: bool = False) -> None:
+        key = url.lower()
+        with self.__lock:
+            if key in self.__pending:
+                _, _, pending_force = self.__pending[key]
+                self.__pending[key] = (url, record, force or pending_force)
+                return
+            self.__pending[key] = (url, record, force)
+        self.__queue.put_nowait(key)
+
+    def get(self, timeout: float) -> tuple[str, RepositoryStatus, bool]:
+        """Return the next (url, record, force) request, or raise Empty"""
+        key = self.__queue.get(timeout=timeout)
+        with self.__lock:
+            return self.__pending.pop(key)
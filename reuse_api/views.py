@@ -2,35 +2,66 @@
 
 """Request handlers for all endpoints."""
 
+from collections.abc import Iterator
+from hashlib import sha1
 from http import HTTPStatus
+from pathlib import Path
 
 from flask import (
     Blueprint,
     Response,
     abort,
     current_app,
+    jsonify,
+    make_response,
     render_template,
     request,
-    send_file,
+    stream_with_context,
     url_for,
 )
+from prometheus_client import CONTENT_TYPE_LATEST
 from requests import post
 from werkzeug.exceptions import HTTPException
 
 from reuse_api import models as db
 from reuse_api.form import RegisterForm
 
-from .config import ADMIN_KEY, FORMS_URL
-from .models import Repository
+from .cache import badge_cache
+from .compression import decompress_stream
+from .config import ADMIN_KEY, FORMS_URL, METRICS, METRICS_TOKEN, STATUS_BATCH_LIMIT
+from .metrics import exposition
+from .models import Repository, RepositoryStatus
 
 
 HTML: Blueprint = Blueprint("html", __name__)
 JSON: Blueprint = Blueprint("json", __name__)
 
+# The badges never change, so they are served from memory
+BADGES: dict[str, bytes] = {
+    status: (Path(__file__).parent / "badges" / f"{status}.svg").read_bytes()
+    for status in db.Status
+}
+
+
+def entity_tag(*parts) -> str:
+    """Strong entity tag for a representation derived from the given values"""
+    return sha1("\0".join(str(part) for part in parts).encode()).hexdigest()
+
+
+def not_modified(etag: str) -> Response | None:
+    """Return an empty 304 response if the client already holds `etag`"""
+    if not request.if_none_match.contains_weak(etag):
+        return None
+    response = Response(status=HTTPStatus.NOT_MODIFIED)
+    response.set_etag(etag)
+    return response
+
 
 @HTML.get("/")
 def index() -> str:
-    return render_template("index.html", compliant_repos=Repository.projects().total)
+    return render_template(
+        "index.html", compliant_repos=len(Repository.compliant_urls())
+    )
 
 
 @HTML.get("/register")
@@ -70,15 +101,20 @@ def register_post() -> tuple[str, HTTPStatus]:
 def badge(url: str) -> Response:
     """The SVG badge for a repo"""
 
-    result = send_file(f"badges/{db.status(url)}.svg", mimetype="image/svg+xml")
+    status = badge_cache.get(url.lower())
+    if status is None:
+        status = db.status(url)
+        badge_cache.put(url.lower(), status)
+
+    # The image only depends on the status, so that is all the tag covers
+    etag = entity_tag(status)
+    result = not_modified(etag) or Response(BADGES[status], mimetype="image/svg+xml")
+    result.set_etag(etag)
 
-    # Disable caching for badge files
+    # Caches may store badge files, but have to revalidate them on every use
     result.cache_control.max_age = 0
     result.cache_control.must_revalidate = True
     result.cache_control.no_cache = True
-    result.cache_control.no_store = True
-    result.cache_control.private = True
-    result.cache_control.public = False
     result.headers["Expires"] = "Thu, 01 Jan 1970 00:00:00 UTC"
 
     return result
@@ -92,9 +128,14 @@ def info(url: str) -> tuple[str, HTTPStatus]:
     if not Repository.is_registered(url):
         return render_template("unregistered.html", url=url), HTTPStatus.NOT_FOUND
 
-    row = current_app.scheduler.schedule(url)
+    # The full row is needed for the lint output, so the scheduler gets a
+    # snapshot of it instead of looking the repository up again.
+    row = Repository.find(url)
+    record = current_app.scheduler.schedule(
+        url, record=None if row is None else RepositoryStatus.from_row(row)
+    )
 
-    if not Repository.is_initialised(url):
+    if record is None or not record.initialised:
         return (
             render_template("uninitialised.html", project_name=db.name(url)),
             HTTPStatus.FAILED_DEPENDENCY,
@@ -107,7 +148,7 @@ def info(url: str) -> tuple[str, HTTPStatus]:
             url=url,
             project_name=db.name(url),
             head_hash=row.hash,
-            compliant=Repository.is_compliant(url),
+            compliant=record.compliant,
             lint_output=row.lint_output,
             last_access=row.last_access.strftime("%d %b %Y %X"),
             sbom=url_for("html.sbom", url=url, _external=False),
@@ -125,16 +166,46 @@ def info(url: str) -> tuple[str, HTTPStatus]:
 
 
 @HTML.get("/sbom/<path:url>.spdx")
-def sbom(url: str) -> str:
+def sbom(url: str) -> Response:
     """SPDX SBOM in tag:value format"""
     # NOTE: This is a temporary measure to see if this feature is used
     current_app.logger.info("ASKED FOR SBOM: %s", url)
 
-    if not Repository.is_initialised(url):
+    record = Repository.lookup(url)
+    if record is None or not record.initialised:
         abort(HTTPStatus.NOT_FOUND)
 
-    row = current_app.scheduler.schedule(url)
-    return row.spdx_output
+    current_app.scheduler.schedule(url, record=record)
+
+    # SBOMs are stored in gzip format. Clients that accept it get them as they
+    # are, all others get them decompressed on the fly.
+    gzip: bool = request.accept_encodings["gzip"] > 0
+    etag = entity_tag(record.status, record.hash, record.last_access, gzip)
+    if response := not_modified(etag):
+        response.vary.add("Accept-Encoding")
+        return response
+
+    blob = Repository.find_sbom_compressed(url)
+    if blob is None:
+        response = make_response("")
+    elif gzip:
+        response = make_response(blob)
+        response.content_encoding = "gzip"
+    else:
+        response = Response(decompress_stream(blob))
+    response.vary.add("Accept-Encoding")
+    response.set_etag(etag)
+    return response
+
+
+def status_json(record: RepositoryStatus) -> dict:
+    """Machine-readable status of a repository"""
+    return {
+        "hash": record.hash,
+        "status": record.status,
+        "lint_code": record.lint_code,
+        "last_access": record.last_access.isoformat() if record.last_access else None,
+    }
 
 
 # Return error messages in JSON format
@@ -146,26 +217,67 @@ def handle_error(err: HTTPException) -> tuple[dict, HTTPStatus]:
 
 @JSON.get("/status/<path:url>")
 @JSON.get("/status/<path:url>.json")
-def status(url: str) -> dict:
+def status(url: str) -> Response:
     """Machine-readable information about a repo in JSON format"""
     if not Repository.is_registered(url):
         abort(HTTPStatus.NOT_FOUND)
 
-    row = current_app.scheduler.schedule(url)
+    record = current_app.scheduler.schedule(url)
+
+    etag = entity_tag(record.status, record.hash, record.last_access)
+    if response := not_modified(etag):
+        return response
+
     # Return the current entry in the database.
-    return {
-        "hash": row.hash,
-        "status": row.status,
-        "lint_code": row.lint_code,
-        "last_access": (row.last_access.isoformat() if row.last_access else None),
+    response = jsonify(status_json(record))
+    response.set_etag(etag)
+    return response
+
+
+@JSON.post("/status")
+def status_batch() -> dict:
+    """Status of many repositories at once.
+
+    Takes a JSON object with a list of `urls`, and returns their statuses keyed
+    by URL from one database query, without waiting for any forge. With
+    `"refresh": true`, their latest commits are fetched in the background as
+    for single requests, and outdated repositories are checked.
+    """
+    body = request.get_json(silent=True)
+    urls = body.get("urls") if isinstance(body, dict) else None
+    if not isinstance(urls, list) or not all(isinstance(url, str) for url in urls):
+        abort(HTTPStatus.BAD_REQUEST, "Expected a JSON object with a list of urls")
+    if len(urls) > STATUS_BATCH_LIMIT:
+        abort(
+            HTTPStatus.REQUEST_ENTITY_TOO_LARGE,
+            f"At most {STATUS_BATCH_LIMIT} urls per request",
+        )
+    refresh: bool = body.get("refresh") is True
+
+    statuses = {
+        url: status_json(RepositoryStatus(url, db.Status.NULL, None, None, None, None))
+        for url in urls
     }
+    registered = Repository.registered(urls)
+    records = Repository.lookup_many(registered)
+    for url in registered:
+        record = records.get(url.lower())
+        if refresh:
+            record = current_app.scheduler.schedule(url, record=record)
+        if record is None:
+            record = RepositoryStatus(url, db.Status.EMPTY, None, None, None, None)
+        statuses[url] = status_json(record)
+    return {"repositories": statuses}
 
 
 @HTML.get("/projects")
 @HTML.get("/projects/page/<int:page>")
 def projects(page: int = 1) -> str:
     """Show paginated table of compliant repositories"""
-    return render_template("projects.html", compliant_list=Repository.projects(page))
+    compliant_list = Repository.projects(page)
+    if page < 1 or (page > 1 and not compliant_list.items):
+        abort(HTTPStatus.NOT_FOUND)
+    return render_template("projects.html", compliant_list=compliant_list)
 
 
 # ------------------------------------------------------------------------------
@@ -179,6 +291,7 @@ def reset(url: str) -> str:
     # Check for valid admin credentials
     if request.form.get("admin_key") != ADMIN_KEY:
         abort(HTTPStatus.UNAUTHORIZED)
+    badge_cache.discard(url.lower())
     # Force re-check
     repository = current_app.scheduler.schedule(url, force=True)
     # If re-check scheduled and repository actually exists
@@ -189,22 +302,71 @@ def reset(url: str) -> str:
     return f"Repository not registered: {url}"
 
 
+@HTML.post("/admin/check-all")
+def check_all() -> str:
+    """Refresh the HEADs of all repositories and re-check outdated ones"""
+
+    # Check for valid admin credentials
+    if request.form.get("admin_key") != ADMIN_KEY:
+        abort(HTTPStatus.UNAUTHORIZED)
+    force: bool = request.form.get("force") == "1"
+    if force:
+        badge_cache.clear()
+    current_app.scheduler.check_all(force=force)
+    return "All repositories scheduled for re-check"
+
+
+def export(records: Iterator[dict], ndjson: bool = False) -> Response:
+    """Stream records as one JSON array, or as newline-delimited JSON"""
+    dumps = current_app.json.dumps
+
+    def generate() -> Iterator[str]:
+        if ndjson:
+            for record in records:
+                yield dumps(record) + "\n"
+            return
+        separator = "["
+        for record in records:
+            yield separator + dumps(record)
+            separator = ","
+        yield "[]\n" if separator == "[" else "]\n"
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype="application/x-ndjson" if ndjson else "application/json",
+    )
+
+
 @JSON.post("/admin/analytics/<string:query>.json")
-def analytics(query) -> dict:
+def analytics(query) -> dict | Response:
     """Show certain analytics, only accessible with admin key"""
 
     # Check for valid admin credentials
     if request.form.get("admin_key") != ADMIN_KEY:
         abort(HTTPStatus.UNAUTHORIZED)
 
+    ndjson: bool = request.form.get("format") == "ndjson"
     match query:
         case "all_projects":
-            return Repository.all_projects()
+            return export(Repository.export(), ndjson)
 
         case "projects_by_status":
             if repo_status := request.form.get("status"):
-                return Repository.projects_by_status(repo_status)
+                return export(Repository.export(repo_status), ndjson)
             return {"error": "Status parameter is missing"}
 
         case _:
             return {"error": "Invalid analytics URL"}
+
+
+@HTML.get("/metrics")
+def prometheus_metrics() -> Response:
+    """Metrics of all processes in the Prometheus text format"""
+    if not METRICS:
+        abort(HTTPStatus.NOT_FOUND)
+    if METRICS_TOKEN and request.headers.get("Authorization") != (
+        f"Bearer {METRICS_TOKEN}"
+    ):
+        abort(HTTPStatus.UNAUTHORIZED)
+    current_app.scheduler.report_queue_depth()
+    return Response(exposition(), mimetype=CONTENT_TYPE_LATEST)
@@ -0,0 +1,36 @@
+"""Standalone lint worker, run with `python -m reuse_api.worker`.
+
+It runs the check queue's runners and the periodic fleet check, but serves no
+requests. Together with RUNNER_MODE=separate for the web processes, web and
+lint capacity can be scaled independently.
+"""
+
+from signal import SIGINT, SIGTERM, signal
+from threading import Event
+
+from prometheus_client import start_http_server
+
+from reuse_api import config, create_app, metrics
+
+
+def main() -> None:
+    if config.TASK_QUEUE != "database":
+        raise ValueError("The worker requires TASK_QUEUE 'database'")
+
+    app = create_app(runners=True)
+    stopped = Event()
+    for signum in (SIGINT, SIGTERM):
+        signal(signum, lambda *_: stopped.set())
+
+    if config.METRICS_PORT:
+        # The worker serves no requests, so its metrics get their own server
+        start_http_server(config.METRICS_PORT, registry=metrics.registry())
+
+    app.logger.info("Worker started with %d runners", config.NB_RUNNER)
+    stopped.wait()
+    app.logger.info("Worker stopping")
+    app.scheduler.join()
+
+
+if __name__ == "__main__":
+    main()
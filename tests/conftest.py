@@ -1,3 +1,4 @@
+import json
 from os import environ
 
 import pytest
@@ -12,9 +13,25 @@ def tmp_json(tmp_path) -> str:
 
 
 @pytest.fixture
-def app(requests_mock, tmp_json):
+def app(requests_mock, tmp_json, monkeypatch):
     """Returns a mocked app with TESTING=True, no CRSF and mocked forms"""
     environ["FORMS_FILE"] = tmp_json
+    # The configuration may already have been imported by another test
+    from reuse_api import config  # noqa: PLC0415
+    from reuse_api.cache import (  # noqa: PLC0415
+        badge_cache,
+        compliant_projects,
+        head_cache,
+        invalid_cache,
+    )
+    from reuse_api.registry import registrations  # noqa: PLC0415
+
+    monkeypatch.setattr(config, "FORMS_FILE", tmp_json)
+    monkeypatch.setattr(registrations, "path", tmp_json)
+    badge_cache.clear()
+    compliant_projects.clear()
+    invalid_cache.clear()
+    head_cache.clear()
 
     # Mock forms
     forms_url: str = "http://totally.forms"
@@ -37,3 +54,43 @@ def app(requests_mock, tmp_json):
 def client(app):
     """A test client for the app."""
     return app.test_client()
+
+
+@pytest.fixture
+def register(tmp_json):
+    """Returns a function that registers project URLs in the forms file."""
+
+    def _register(*urls: str) -> None:
+        with open(tmp_json) as f:
+            projects = json.load(f)
+        projects.extend({"include_vars": {"project": url}} for url in urls)
+        with open(tmp_json, "w") as f:
+            json.dump(projects, f)
+
+    return _register
+
+
+@pytest.fixture
+def fake_git(monkeypatch):
+    """Answers every ls-remote with a fixed hash instead of asking the forge."""
+    from reuse_api import scheduler  # noqa: PLC0415
+
+    head: str = "0" * 40
+
+    def latest_hash(protocol: str, url: str) -> str:
+        return head
+
+    monkeypatch.setattr(scheduler, "latest_hash", latest_hash)
+    return head
+
+
+@pytest.fixture
+def workers(app, monkeypatch):
+    """Gives runners created from here on their own pool of worker hosts, so
+    that they do not wait for the app's idle runners."""
+    from reuse_api import scheduler  # noqa: PLC0415
+    from reuse_api.ssh import WorkerPool  # noqa: PLC0415
+
+    pool = WorkerPool({"worker.example": 2})
+    monkeypatch.setattr(scheduler, "workers", pool)
+    return pool
@@ -0,0 +1,42 @@
+import pytest
+from werkzeug.exceptions import ServiceUnavailable, TooManyRequests
+
+from reuse_api.admission import Admission
+
+
+def test_limit_per_client():
+    admission = Admission(limit=3, per_client=1, retry_after=10)
+
+    with admission.admit("a"):
+        with pytest.raises(TooManyRequests) as error, admission.admit("a"):
+            pass
+        assert error.value.retry_after == 10  # noqa: PLR2004
+        with admission.admit("b"):
+            assert len(admission) == 2  # noqa: PLR2004
+
+    with admission.admit("a"):
+        pass
+    assert len(admission) == 0
+
+
+def test_limit_in_total():
+    admission = Admission(limit=2, per_client=2, retry_after=10)
+
+    with (
+        admission.admit("a"),
+        admission.admit("b"),
+        pytest.raises(ServiceUnavailable),
+        admission.admit("c"),
+    ):
+        pass
+    with admission.admit("c"):
+        assert len(admission) == 1
+
+
+def test_slot_released_on_error():
+    admission = Admission(limit=1, per_client=1, retry_after=10)
+
+    with pytest.raises(RuntimeError), admission.admit("a"):
+        raise RuntimeError
+
+    assert len(admission) == 0
@@ -0,0 +1,53 @@
+from reuse_api.cache import ProjectListing, TTLCache
+
+
+def test_least_recently_used_is_evicted():
+    cache = TTLCache(maxsize=2, ttl=60)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    cache.get("a")
+    cache.put("c", 3)
+
+    assert cache.get("a") == 1
+    assert cache.get("b") is None
+    assert cache.get("c") == 3  # noqa: PLR2004
+
+
+def test_entries_expire(monkeypatch):
+    from reuse_api import cache as module  # noqa: PLC0415
+
+    now = [100.0]
+    monkeypatch.setattr(module, "monotonic", lambda: now[0])
+    cache = TTLCache(maxsize=2, ttl=10)
+    cache.put("a", 1)
+
+    now[0] += 9
+    assert cache.get("a") == 1
+    now[0] += 1
+    assert cache.get("a") is None
+    assert len(cache) == 0
+
+
+def test_project_listing(monkeypatch):
+    from reuse_api import cache as module  # noqa: PLC0415
+
+    now = [100.0]
+    monkeypatch.setattr(module, "monotonic", lambda: now[0])
+    loads = []
+
+    def load() -> list[str]:
+        loads.append(now[0])
+        return ["a/b/new", "a/b/old"]
+
+    listing = ProjectListing(ttl=10)
+    assert listing.urls(load) == ["a/b/new", "a/b/old"]
+
+    listing.update("A/B/old", compliant=True)
+    listing.update("a/b/new", compliant=False)
+    listing.update("a/b/other", compliant=True)
+    assert listing.urls(load) == ["a/b/other", "A/B/old"]
+    assert len(loads) == 1
+
+    now[0] += 10
+    assert listing.urls(load) == ["a/b/new", "a/b/old"]
+    assert len(loads) == 2  # noqa: PLR2004
@@ -0,0 +1,16 @@
+from reuse_api.compression import compress, decompress, decompress_stream
+
+
+def test_round_trip():
+    assert decompress(compress("SPDXVersion: SPDX-2.1")) == "SPDXVersion: SPDX-2.1"
+    assert compress(None) is None
+    assert decompress(None) is None
+
+
+def test_decompress_stream_in_chunks():
+    text = "FileName: ./src/main.py\n" * 100000
+    chunks = list(decompress_stream(compress(text), chunk_size=4096))
+
+    assert len(chunks) > 1
+    assert all(len(chunk) <= 4096 for chunk in chunks)  # noqa: PLR2004
+    assert b"".join(chunks).decode() == text
@@ -0,0 +1,128 @@
+import os
+import subprocess
+from os import environ
+from threading import Thread
+from time import sleep
+
+import pytest
+
+from reuse_api import local, scheduler
+from reuse_api.models import Repository, db
+from reuse_api.scheduler import Runner
+from reuse_api.task import DatabaseTaskQueue, Task, TaskQueue
+
+
+FAKE_REUSE: str = """#!/bin/sh
+case "$1" in
+  lint) test -e LICENSES/MIT.txt && echo "Congratulations!" && exit 0
+        echo "Missing licenses"; exit 1 ;;
+  spdx) echo "SPDXVersion: SPDX-2.1" ;;
+esac
+"""
+
+
+@pytest.fixture
+def repository(tmp_path, monkeypatch) -> str:
+    """Creates a Git repository and puts a fake reuse tool on the PATH."""
+    bin_dir = tmp_path / "bin"
+    bin_dir.mkdir()
+    (bin_dir / "reuse").write_text(FAKE_REUSE)
+    (bin_dir / "reuse").chmod(0o755)
+    monkeypatch.setenv("PATH", f"{bin_dir}:{environ['PATH']}")
+
+    repo = tmp_path / "repo"
+    (repo / "LICENSES").mkdir(parents=True)
+    (repo / "LICENSES" / "MIT.txt").write_text("MIT")
+    git = ["git", "-C", str(repo), "-c", "user.name=t", "-c", "user.email=t@t"]
+    subprocess.run(["git", "init", "--quiet", str(repo)], check=True)
+    subprocess.run([*git, "add", "."], check=True)
+    subprocess.run([*git, "commit", "--quiet", "-m", "init"], check=True)
+    return str(repo)
+
+
+def test_lint_output(repository):
+    output = local.lint(f"file://{repository}")
+
+    assert output == {
+        "exit_code": 0,
+        "lint_output": "Congratulations!\n",
+        "spdx_output": "SPDXVersion: SPDX-2.1\n",
+    }
+
+
+def test_lint_unreachable(tmp_path):
+    assert local.lint(f"file://{tmp_path}/missing") is None
+
+
+def test_local_workers_limit():
+    workers = local.LocalWorkers(1)
+
+    connection = workers.acquire(timeout=0)
+    assert connection.host == "localhost"
+    assert workers.acquire(timeout=0) is None
+    workers.release(connection)
+    assert workers.acquire(timeout=0) is connection
+
+
+def test_runner_lints_locally(app, repository, monkeypatch):
+    monkeypatch.setattr(scheduler, "workers", local.LocalWorkers(1))
+    with app.app_context():
+        db.session.add(Repository(url=repository))
+        db.session.commit()
+
+    queue = DatabaseTaskQueue(app)
+    queue.put_nowait(Task("file", repository, "0" * 40))
+    runner = Runner(queue, app)
+    runner.start()
+    for _ in range(100):
+        if not len(queue):
+            break
+        sleep(0.1)
+    runner.join()
+
+    with app.app_context():
+        record = Repository.find(repository)
+        assert record.status == "compliant"
+        assert record.spdx_output == "SPDXVersion: SPDX-2.1\n"
+
+
+@pytest.mark.parametrize("stop", ["timeout", "shutdown"])
+def test_runner_stops_local_lint_entirely(app, tmp_path, monkeypatch, stop):
+    """The clone does not outlive the check, and its scratch directory is gone"""
+    bin_dir = tmp_path / "bin"
+    bin_dir.mkdir()
+    (bin_dir / "git").write_text('#!/bin/sh\necho $$ > "$GIT_PID"\nexec sleep 60\n')
+    (bin_dir / "git").chmod(0o755)
+    scratch = tmp_path / "tmp"
+    scratch.mkdir()
+    pid_file = tmp_path / "git.pid"
+    monkeypatch.setenv("PATH", f"{bin_dir}:{environ['PATH']}")
+    monkeypatch.setenv("TMPDIR", str(scratch))
+    monkeypatch.setenv("GIT_PID", str(pid_file))
+
+    runner = Runner(TaskQueue(), app)
+    runner._Runner__running = True  # noqa: SLF001
+    command = local.LocalConnection().lint_command("https", "fsfe.org/a/b")
+    if stop == "timeout":
+        with pytest.raises(subprocess.TimeoutExpired):
+            runner._execute(command, timeout=3)  # noqa: SLF001
+    else:
+
+        def stop_while_cloning() -> None:
+            while not pid_file.exists():
+                sleep(0.05)
+            runner.stop()
+
+        Thread(target=stop_while_cloning, daemon=True).start()
+        assert runner._execute(command, timeout=10).returncode < 0  # noqa: SLF001
+
+    git = int(pid_file.read_text())
+    for _ in range(50):
+        try:
+            os.kill(git, 0)
+        except ProcessLookupError:
+            break
+        sleep(0.1)
+    else:
+        pytest.fail("git clone is still running")
+    assert not any(scratch.iterdir())
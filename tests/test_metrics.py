@@ -0,0 +1,113 @@
+import subprocess
+import sys
+from os import environ
+
+import pytest
+from prometheus_client import REGISTRY
+
+from reuse_api import scheduler, views
+from reuse_api.scheduler import InvalidRepositoryError, determine_protocol
+from reuse_api.task import DatabaseTaskQueue, Priority, Task
+
+
+def sample(name: str, **labels) -> float:
+    return REGISTRY.get_sample_value(name, labels) or 0
+
+
+def test_metrics_disabled(client):
+    assert client.get("/metrics").status_code == 404  # noqa: PLR2004
+
+
+def test_endpoint_latency(client, monkeypatch):
+    monkeypatch.setattr(views, "METRICS", True)
+    before = sample("reuse_api_request_duration_seconds_count", endpoint="html.badge")
+
+    client.get("/badge/fsfe.org/reuse/api")
+    response = client.get("/metrics")
+
+    assert response.status_code == 200  # noqa: PLR2004
+    assert b'reuse_api_request_duration_seconds_count{endpoint="html.badge"}' in (
+        response.data
+    )
+    assert b"reuse_api_db_query_duration_seconds" in response.data
+    after = sample("reuse_api_request_duration_seconds_count", endpoint="html.badge")
+    assert after == before + 1
+
+
+def test_metrics_token(client, monkeypatch):
+    monkeypatch.setattr(views, "METRICS", True)
+    monkeypatch.setattr(views, "METRICS_TOKEN", "s3cret")
+
+    assert client.get("/metrics").status_code == 401  # noqa: PLR2004
+    wrong = {"Authorization": "Bearer guess"}
+    assert client.get("/metrics", headers=wrong).status_code == 401  # noqa: PLR2004
+    right = {"Authorization": "Bearer s3cret"}
+    assert client.get("/metrics", headers=right).status_code == 200  # noqa: PLR2004
+
+
+def test_probe_failures_per_forge(monkeypatch):
+    def latest_hash(protocol: str, url: str) -> str:
+        if protocol != "git" or url.endswith("/gone"):
+            raise InvalidRepositoryError
+        return "0" * 40
+
+    monkeypatch.setattr(scheduler, "latest_hash", latest_hash)
+    before = sample("reuse_api_probe_failures_total", host="codeberg.org")
+    before_other = sample("reuse_api_probe_failures_total", host="other")
+
+    determine_protocol("Codeberg.org/a/b")
+    with pytest.raises(InvalidRepositoryError):
+        determine_protocol("probe.example/a/gone", preferred="https")
+
+    assert sample("reuse_api_probe_failures_total", host="codeberg.org") == before + 1
+    assert sample("reuse_api_probe_failures_total", host="other") == before_other + 3
+    assert sample("reuse_api_probe_failures_total", host="probe.example") == 0
+
+
+def test_failed_statement_is_not_timed(app):
+    from sqlalchemy.exc import OperationalError  # noqa: PLC0415
+
+    from reuse_api.models import db  # noqa: PLC0415
+
+    with app.app_context(), db.engine.connect() as connection:
+        with pytest.raises(OperationalError):
+            connection.exec_driver_sql("SELECT * FROM missing")
+        assert "query_started" not in connection.info
+
+        connection.exec_driver_sql("SELECT 1")
+        assert "query_started" not in connection.info
+
+
+def test_database_queue_depth(app):
+    queue = DatabaseTaskQueue(app)
+    queue.put_nowait(Task("https", "fsfe.org/a/b", "0" * 40), Priority.NEW)
+    queue.put_nowait(Task("https", "fsfe.org/a/c", "0" * 40))
+    queue.put_nowait(Task("https", "fsfe.org/a/d", "0" * 40))
+
+    assert queue.depths() == {"new": 1, "outdated": 0, "bulk": 2}
+    queue.get(timeout=0)
+    assert queue.depths() == {"new": 0, "outdated": 0, "bulk": 2}
+
+
+def test_aggregated_across_processes(tmp_path):
+    env = {**environ, "PROMETHEUS_MULTIPROC_DIR": str(tmp_path)}
+    count = (
+        "from reuse_api import metrics; "
+        "metrics.PROBE_FAILURES.labels('codeberg.org').inc()"
+    )
+    for _ in range(3):
+        subprocess.run([sys.executable, "-c", count], env=env, check=True)
+
+    show = (
+        "import sys; from reuse_api import metrics; "
+        "sys.stdout.write(metrics.exposition().decode())"
+    )
+    exposition = subprocess.run(
+        [sys.executable, "-c", show],
+        env=env,
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout
+
+    assert 'reuse_api_probe_failures_total{host="codeberg.org"} 3.0' in exposition
@@ -0,0 +1,56 @@
+import sqlite3
+
+from sqlalchemy import inspect, text
+
+
+def test_old_database_migrated(tmp_path, monkeypatch, requests_mock, tmp_json):
+    from reuse_api import config  # noqa: PLC0415
+    from reuse_api.registry import registrations  # noqa: PLC0415
+
+    database = tmp_path / "old.db"
+    with sqlite3.connect(database) as connection:
+        connection.execute(
+            "CREATE TABLE repository (url VARCHAR PRIMARY KEY, hash VARCHAR(40), "
+            "status VARCHAR(13), lint_code SMALLINT, lint_output TEXT, "
+            "spdx_output TEXT, last_access DATETIME)"
+        )
+        connection.execute("INSERT INTO repository (url) VALUES ('fsfe.org/a/b')")
+        connection.execute(
+            "INSERT INTO repository (url, lint_output, spdx_output) "
+            "VALUES ('fsfe.org/a/c', 'lint', 'SPDXVersion: SPDX-2.1')"
+        )
+
+    monkeypatch.setattr(config, "SQLALCHEMY_DATABASE_URI", f"sqlite:///{database}")
+    monkeypatch.setattr(config, "FORMS_FILE", tmp_json)
+    monkeypatch.setattr(registrations, "path", tmp_json)
+
+    from reuse_api import create_app  # noqa: PLC0415
+    from reuse_api.models import Repository, db  # noqa: PLC0415
+
+    app = create_app()
+    try:
+        with app.app_context():
+            columns = {c["name"] for c in inspect(db.engine).get_columns("repository")}
+            assert "protocol" in columns
+            assert Repository.lookup("fsfe.org/a/b").protocol is None
+
+            # Outputs moved to the compressed columns
+            assert {"lint_output_gz", "spdx_output_gz"} <= columns
+            assert Repository.find_sbom("fsfe.org/a/c") == "SPDXVersion: SPDX-2.1"
+            assert Repository.find("fsfe.org/a/c").lint_output == "lint"
+            assert Repository.find("fsfe.org/a/b").lint_output is None
+            old = db.session.execute(
+                text("SELECT lint_output, spdx_output FROM repository")
+            ).all()
+            assert all(row == (None, None) for row in old)
+
+            indexes = db.session.execute(
+                text("SELECT name FROM sqlite_master WHERE type = 'index'")
+            ).scalars()
+            assert {
+                "ix_repository_lower_url",
+                "ix_repository_status_last_access",
+                "ix_repository_last_access_url",
+            } <= set(indexes)
+    finally:
+        app.scheduler.join()
@@ -0,0 +1,124 @@
+import warnings
+from datetime import datetime, timedelta
+
+from sqlalchemy import inspect
+from sqlalchemy.exc import SAWarning
+
+from reuse_api import models
+from reuse_api.models import LintResult, Repository, db
+
+
+def test_least_recently_checked(app):
+    with app.app_context():
+        db.session.add_all(
+            [
+                Repository(url="fsfe.org/a/new", last_access=None),
+                Repository(url="fsfe.org/a/old", last_access=datetime(2020, 1, 1)),
+                Repository(url="fsfe.org/a/older", last_access=datetime(2019, 1, 1)),
+                Repository(url="fsfe.org/b/same", last_access=datetime(2020, 1, 1)),
+                Repository(url="fsfe.org/a/recent", last_access=datetime(2024, 1, 1)),
+            ]
+        )
+        db.session.commit()
+
+        urls = [r.url for r in Repository.least_recently_checked(batch=2)]
+
+    assert urls == [
+        "fsfe.org/a/new",
+        "fsfe.org/a/older",
+        "fsfe.org/a/old",
+        "fsfe.org/b/same",
+        "fsfe.org/a/recent",
+    ]
+
+
+def test_lint_result_counts_hits(app):
+    with app.app_context():
+        assert LintResult.use("a" * 40) is None
+
+        LintResult.store("a" * 40, 0, "lint", "spdx")
+        LintResult.use("a" * 40)
+        result = LintResult.use("a" * 40)
+
+        assert (result.lint_code, result.spdx_output) == (0, "spdx")
+        assert result.hits == 2  # noqa: PLR2004
+
+
+def test_lint_result_prune(app):
+    with app.app_context():
+        LintResult.store("a" * 40, 0, "lint", "spdx")
+        db.session.add(
+            LintResult(hash="b" * 40, lint_code=1, last_used=datetime(2020, 1, 1))
+        )
+        db.session.commit()
+
+        assert LintResult.prune(timedelta(days=30)) == 1
+        assert LintResult.use("a" * 40) is not None
+
+
+def test_lint_result_prune_if_due(app, monkeypatch):
+    now = 1000.0
+    monkeypatch.setattr(models, "monotonic", lambda: now)
+    monkeypatch.setattr(models, "_next_prune", 0)
+
+    def old_result(hash_: str) -> None:
+        db.session.add(
+            LintResult(hash=hash_, lint_code=1, last_used=datetime(2020, 1, 1))
+        )
+        db.session.commit()
+
+    with app.app_context():
+        old_result("a" * 40)
+        assert LintResult.prune_if_due(timedelta(days=30), interval=60) == 1
+
+        old_result("b" * 40)
+        now += 59
+        assert LintResult.prune_if_due(timedelta(days=30), interval=60) == 0
+        now += 1
+        assert LintResult.prune_if_due(timedelta(days=30), interval=60) == 1
+
+
+def test_outputs_stored_compressed(app):
+    spdx = "SPDXVersion: SPDX-2.1\n" * 1000
+    with app.app_context():
+        db.session.add(Repository(url="fsfe.org/a/b", spdx_output=spdx))
+        db.session.commit()
+        record = Repository.find("fsfe.org/a/b")
+
+        assert record.spdx_output_gz.startswith(b"\x1f\x8b")
+        assert len(record.spdx_output_gz) < len(spdx) / 10
+        assert record.spdx_output == spdx
+        assert record.lint_output is None
+
+
+def test_export_pages_through_urls(app):
+    with app.app_context():
+        db.session.add_all(
+            Repository(url=f"fsfe.org/a/{i}", status="compliant" if i % 2 else None)
+            for i in range(7)
+        )
+        db.session.commit()
+
+        assert [r["url"] for r in Repository.export(batch=2)] == [
+            f"fsfe.org/a/{i}" for i in range(7)
+        ]
+        assert [r["url"] for r in Repository.export("compliant", batch=2)] == [
+            "fsfe.org/a/1",
+            "fsfe.org/a/3",
+            "fsfe.org/a/5",
+        ]
+
+
+def test_repository_indexes(app):
+    """How the queries use them on a large database is shown by `python -m
+    benchmarks`."""
+    with app.app_context(), warnings.catch_warnings():
+        # SQLite cannot reflect the index on lower(url), see test_migrations
+        warnings.simplefilter("ignore", SAWarning)
+        indexes = {
+            index["name"]: index["column_names"]
+            for index in inspect(db.engine).get_indexes("repository")
+        }
+
+    assert indexes["ix_repository_status_last_access"] == ["status", "last_access"]
+    assert indexes["ix_repository_last_access_url"] == ["last_access", "url"]
@@ -0,0 +1,42 @@
+import json
+from os import utime
+
+from reuse_api.registry import RegistrationIndex
+
+
+def write_projects(path, *urls: str) -> None:
+    """Write a forms file containing the given project URLs."""
+    path.write_text(json.dumps([{"include_vars": {"project": url}} for url in urls]))
+
+
+def test_lookup_is_case_insensitive(tmp_path):
+    forms = tmp_path / "repos.json"
+    write_projects(forms, "Codeberg.org/Org/Repo")
+    index = RegistrationIndex(str(forms))
+
+    assert "codeberg.org/org/repo" in index
+    assert "codeberg.org/org/other" not in index
+
+
+def test_reloads_when_file_changes(tmp_path):
+    forms = tmp_path / "repos.json"
+    write_projects(forms, "codeberg.org/org/repo")
+    index = RegistrationIndex(str(forms))
+    assert len(index) == 1
+
+    write_projects(forms, "codeberg.org/org/repo", "codeberg.org/org/new")
+    utime(forms, ns=(0, 10**18))
+
+    assert "codeberg.org/org/new" in index
+    assert len(index) == 2  # noqa: PLR2004
+
+
+def test_keeps_index_on_partial_write(tmp_path):
+    forms = tmp_path / "repos.json"
+    write_projects(forms, "codeberg.org/org/repo")
+    index = RegistrationIndex(str(forms))
+    assert "codeberg.org/org/repo" in index
+
+    forms.write_text('[{"include_vars": ')
+
+    assert "codeberg.org/org/repo" in index
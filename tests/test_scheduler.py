@@ -0,0 +1,313 @@
+import subprocess
+from collections import Counter
+from os import environ
+from threading import Lock
+from time import monotonic, sleep
+
+import pytest
+
+from reuse_api import scheduler
+from reuse_api.models import LintResult, QueuedTask, Repository, db
+from reuse_api.scheduler import (
+    FleetChecker,
+    ForgeUnavailableError,
+    InvalidRepositoryError,
+    Refresher,
+    Runner,
+    determine_protocol,
+    probe_many,
+)
+from reuse_api.task import DatabaseTaskQueue, RefreshQueue, Task, TaskQueue
+
+
+@pytest.fixture
+def forge(monkeypatch):
+    """Fake ls-remote that only answers for the given protocols."""
+    calls: list[str] = []
+    working: set[str] = set()
+
+    def latest_hash(protocol: str, url: str) -> str:
+        calls.append(protocol)
+        if protocol not in working:
+            raise InvalidRepositoryError
+        return protocol[0] * 40
+
+    monkeypatch.setattr(scheduler, "latest_hash", latest_hash)
+    return calls, working
+
+
+def test_determine_protocol_falls_back(forge):
+    calls, working = forge
+    working.add("http")
+
+    assert determine_protocol("fsfe.org/a/b") == ("http", "h" * 40)
+    assert calls == ["https", "git", "http"]
+
+
+def test_determine_protocol_tries_preferred_first(forge):
+    calls, working = forge
+    working.update(("https", "git"))
+
+    assert determine_protocol("fsfe.org/a/b", preferred="git") == ("git", "g" * 40)
+    assert calls == ["git"]
+
+
+def test_determine_protocol_invalid(forge):
+    with pytest.raises(InvalidRepositoryError):
+        determine_protocol("fsfe.org/a/b", preferred="git")
+
+
+@pytest.mark.parametrize(
+    ("stderr", "error"),
+    [
+        (
+            b"fatal: repository 'https://fsfe.org/a/b/' not found",
+            InvalidRepositoryError,
+        ),
+        (
+            b"fatal: could not read Username: terminal prompts disabled",
+            InvalidRepositoryError,
+        ),
+        (
+            b"fatal: unable to access: Could not resolve host: fsfe.org",
+            ForgeUnavailableError,
+        ),
+        (
+            b"fatal: unable to access: The requested URL returned error: 502",
+            ForgeUnavailableError,
+        ),
+        (
+            b"fatal: remote error: The unauthenticated git protocol is not supported",
+            ForgeUnavailableError,
+        ),
+    ],
+)
+def test_latest_hash_tells_missing_from_unavailable(monkeypatch, stderr, error):
+    def run(cmd, **_):
+        return subprocess.CompletedProcess(cmd, 128, b"", stderr)
+
+    monkeypatch.setattr(scheduler.subprocess, "run", run)
+
+    with pytest.raises(error) as raised:
+        scheduler.latest_hash("https", "fsfe.org/a/b")
+    assert (raised.type is ForgeUnavailableError) == (error is ForgeUnavailableError)
+
+
+def test_determine_protocol_missing_if_any_protocol_answered(monkeypatch):
+    def latest_hash(protocol: str, url: str) -> str:
+        # Like github.com: git:// is refused, http times out
+        if protocol == "https":
+            raise InvalidRepositoryError
+        raise ForgeUnavailableError
+
+    monkeypatch.setattr(scheduler, "latest_hash", latest_hash)
+
+    with pytest.raises(InvalidRepositoryError) as raised:
+        determine_protocol("github.com/a/b")
+    assert raised.type is InvalidRepositoryError
+
+
+def test_determine_protocol_unavailable(monkeypatch):
+    def latest_hash(protocol: str, url: str) -> str:
+        raise ForgeUnavailableError
+
+    monkeypatch.setattr(scheduler, "latest_hash", latest_hash)
+
+    with pytest.raises(ForgeUnavailableError):
+        determine_protocol("fsfe.org/a/b")
+
+
+def test_probe_many_limits_concurrency_per_host(monkeypatch):
+    lock = Lock()
+    active: Counter[str] = Counter()
+    peak: Counter[str] = Counter()
+
+    def latest_hash(protocol: str, url: str) -> str:
+        host = url.split("/", maxsplit=1)[0]
+        with lock:
+            active[host] += 1
+            peak[host] = max(peak[host], active[host])
+        sleep(0.01)
+        with lock:
+            active[host] -= 1
+        if url.endswith("dead"):
+            raise InvalidRepositoryError
+        return "a" * 40
+
+    monkeypatch.setattr(scheduler, "latest_hash", latest_hash)
+    repositories = [(f"codeberg.org/org/{i}", "https") for i in range(20)]
+    repositories += [(f"github.com/org/{i}", None) for i in range(20)]
+    repositories.append(("github.com/org/dead", "git"))
+
+    results = list(probe_many(repositories, workers=6, per_host=2))
+
+    assert len(results) == len(repositories)
+    assert max(peak.values()) <= 2  # noqa: PLR2004
+    dead = next(r for r in results if r.url == "github.com/org/dead")
+    assert dead.hash is None
+    assert dead.error
+    assert all(r.hash == "a" * 40 for r in results if r is not dead)
+
+
+@pytest.mark.usefixtures("workers")
+def test_runner_hands_back_task_on_shutdown(app, tmp_path, monkeypatch):
+    ssh = tmp_path / "ssh"
+    ssh.write_text("#!/bin/sh\nexec sleep 60\n")
+    ssh.chmod(0o755)
+    monkeypatch.setenv("PATH", f"{tmp_path}:{environ['PATH']}")
+
+    queue = DatabaseTaskQueue(app)
+    task = Task("https", "fsfe.org/reuse/api", "0" * 40)
+    queue.put_nowait(task)
+    runner = Runner(queue, app)
+    runner.start()
+    for _ in range(50):
+        if runner._process is not None:  # noqa: SLF001
+            break
+        sleep(0.1)
+
+    started = monotonic()
+    runner.join()
+
+    assert monotonic() - started < 5  # noqa: PLR2004
+    with app.app_context():
+        row = db.session.get(QueuedTask, task.url)
+        assert row.owner is None
+        assert row.attempts == 0
+    assert queue.get(timeout=0) == task
+
+
+def test_lint_retry_shares_the_timeout(app, monkeypatch):
+    monkeypatch.setattr(scheduler, "LINT_TIMEOUT", 1.0)
+    monkeypatch.setattr(scheduler, "SSH_MULTIPLEX", True)
+
+    class StaleConnection:
+        host = "wrk1.api.reuse.software"
+
+        def lint_command(self, _protocol, _url):
+            return ["sh", "-c", "sleep 0.6; exit 255"]
+
+        def connect(self):
+            pass
+
+        def reset(self):
+            pass
+
+    runner = Runner(TaskQueue(), app)
+    runner._Runner__running = True  # noqa: SLF001
+    task = Task("https", "fsfe.org/reuse/api", "0" * 40)
+
+    started = monotonic()
+    with pytest.raises(subprocess.TimeoutExpired):
+        runner._lint(task, StaleConnection())  # noqa: SLF001
+    assert monotonic() - started < 1.15  # noqa: PLR2004
+
+
+def test_fork_reuses_lint_result(app, register, fake_git):
+    fork = "github.com/fsfe/reuse-api"
+    register(fork)
+    with app.app_context():
+        Repository.create(url=fork)
+        LintResult.store(fake_git, 0, "lint", "spdx")
+
+        app.scheduler.refresh(fork, Repository.lookup(fork))
+
+        assert Repository.lookup(fork).compliant
+        assert LintResult.use(fake_git).hits == 2  # noqa: PLR2004
+
+
+def test_forced_check_bypasses_lint_result(app, register, fake_git):
+    url = "codeberg.org/fsfe/reuse-api"
+    register(url)
+    with app.app_context():
+        Repository.create(url=url)
+        LintResult.store(fake_git, 0, "lint", "spdx")
+
+        app.scheduler.refresh(url, Repository.lookup(url), force=True)
+
+        assert not Repository.lookup(url).initialised
+        assert LintResult.use(fake_git).hits == 1
+
+
+def test_fleet_check_rate_survives_triggers(app, monkeypatch):
+    rate, batch, repositories = 20.0, 2, 8
+    monkeypatch.setattr(scheduler, "FLEET_CHECK_RATE", rate)
+    monkeypatch.setattr(scheduler, "FLEET_CHECK_BATCH", batch)
+    with app.app_context():
+        for i in range(repositories):
+            db.session.add(Repository(url=f"fsfe.org/fleet/repo{i}"))
+        db.session.commit()
+
+    probed: list[float] = []
+
+    class Probes:
+        def refresh_many(self, records, _force=False):
+            for record in records:
+                probed.append(monotonic())
+                yield record
+
+    checker = FleetChecker(TaskQueue(), Probes(), app, interval=0)
+    checker.start()
+    checker.trigger()
+    for _ in range(10):
+        sleep(0.02)
+        checker.trigger()
+    for _ in range(100):
+        if len(probed) >= repositories:
+            break
+        sleep(0.05)
+    checker.join()
+
+    # Every batch but the last waits for its share of the budget
+    budget = (repositories - batch) / rate
+    assert probed[repositories - 1] - probed[0] >= budget * 0.9
+
+
+def test_fleet_check_ends_transaction_per_batch(app, monkeypatch):
+    monkeypatch.setattr(scheduler, "FLEET_CHECK_RATE", 1000.0)
+    monkeypatch.setattr(scheduler, "FLEET_CHECK_BATCH", 2)
+    with app.app_context():
+        for i in range(5):
+            db.session.add(Repository(url=f"fsfe.org/fleet/repo{i}"))
+        db.session.commit()
+
+    in_transaction: list[bool] = []
+
+    class Probes:
+        def refresh_many(self, records, _force=False):
+            in_transaction.append(db.session().in_transaction())
+            yield from records
+
+    checker = FleetChecker(TaskQueue(), Probes(), app, interval=0)
+    checker._FleetChecker__running = True  # noqa: SLF001
+    checker.check_all()
+
+    assert in_transaction == [False, False, False]
+
+
+def test_refresher_survives_failing_refresh(app):
+    refreshed: list[str] = []
+
+    class Refreshes:
+        def refresh(self, url, _record, _force=False):
+            refreshed.append(url)
+            if len(refreshed) == 1:
+                raise RuntimeError("database gone")
+
+    queue = RefreshQueue()
+    refresher = Refresher(queue, Refreshes(), app)
+    refresher.start()
+    queue.request("fsfe.org/a/b", None)
+    for _ in range(50):
+        if refreshed:
+            break
+        sleep(0.02)
+    # Requesting the URL again after the failure refreshes it again
+    queue.request("fsfe.org/a/b", None)
+    for _ in range(50):
+        if len(refreshed) == 2:  # noqa: PLR2004
+            break
+        sleep(0.02)
+    refresher.join()
+
+    assert refreshed == ["fsfe.org/a/b", "fsfe.org/a/b"]
@@ -0,0 +1,146 @@
+from os import environ
+from time import monotonic, sleep
+
+import pytest
+
+from reuse_api import scheduler, ssh
+from reuse_api.models import Repository, db
+from reuse_api.scheduler import Runner
+from reuse_api.task import DatabaseTaskQueue, Task
+
+
+FAKE_SSH: str = """#!/bin/sh
+echo "$@" >> "$FAKE_SSH_DIR/log"
+case "$*" in
+  *"-O check"*) test -e "$FAKE_SSH_DIR/master"; exit $? ;;
+  *"-O exit"*) rm -f "$FAKE_SSH_DIR/master"; exit 0 ;;
+  *"-M -N -f"*) touch "$FAKE_SSH_DIR/master"; exit 0 ;;
+esac
+if [ -e "$FAKE_SSH_DIR/stale" ]; then rm "$FAKE_SSH_DIR/stale"; exit 255; fi
+case "$*" in *"@down.example"*) exit 255 ;; esac
+echo '{"exit_code": 0, "lint_output": "", "spdx_output": ""}'
+"""
+
+
+@pytest.fixture
+def fake_ssh(tmp_path, monkeypatch):
+    """Puts an ssh on the PATH that simulates a multiplexed connection."""
+    (tmp_path / "ssh").write_text(FAKE_SSH)
+    (tmp_path / "ssh").chmod(0o755)
+    monkeypatch.setenv("PATH", f"{tmp_path}:{environ['PATH']}")
+    monkeypatch.setenv("FAKE_SSH_DIR", str(tmp_path))
+    monkeypatch.setattr(ssh, "SSH_MULTIPLEX", True)
+    monkeypatch.setattr(scheduler, "SSH_MULTIPLEX", True)
+    return tmp_path
+
+
+def test_connection_starts_master_once(fake_ssh):
+    connection = ssh.Connection("worker.example")
+
+    assert not connection.is_alive()
+    assert connection.connect()
+    assert connection.connect()
+    assert connection.is_alive()
+
+    log = (fake_ssh / "log").read_text()
+    assert log.count("-M -N -f") == 1
+    assert "ControlPath=" in log
+
+
+@pytest.mark.usefixtures("workers")
+def test_runner_reconnects_stale_master(app, fake_ssh):
+    url = "fsfe.org/reuse/api"
+    with app.app_context():
+        db.session.add(Repository(url=url))
+        db.session.commit()
+    (fake_ssh / "master").touch()
+    (fake_ssh / "stale").touch()
+
+    queue = DatabaseTaskQueue(app)
+    queue.put_nowait(Task("https", url, "0" * 40))
+    runner = Runner(queue, app)
+    runner.start()
+    for _ in range(50):
+        if not len(queue):
+            break
+        sleep(0.1)
+    runner.join()
+
+    with app.app_context():
+        assert Repository.lookup(url).status == "compliant"
+    log = (fake_ssh / "log").read_text().splitlines()
+    assert sum("reuse_lint_repo" in line for line in log) == 2  # noqa: PLR2004
+    assert any("-O exit" in line for line in log)
+
+
+def test_pool_parses_hosts_and_limits():
+    pool = ssh.WorkerPool.parse("a.example=2, b.example", default_limit=6)
+
+    assert pool.load() == {"a.example": 0, "b.example": 0}
+    assert [pool.acquire(timeout=0).host for _ in range(8)].count("a.example") == 2  # noqa: PLR2004
+    assert pool.acquire(timeout=0) is None
+
+
+def test_pool_prefers_least_loaded_host():
+    pool = ssh.WorkerPool({"a.example": 4, "b.example": 2})
+
+    hosts = [pool.acquire(timeout=0).host for _ in range(3)]
+
+    assert sorted(hosts) == ["a.example", "a.example", "b.example"]
+    assert pool.load() == {"a.example": 2, "b.example": 1}
+
+
+def test_pool_ejects_failing_host(monkeypatch):
+    now = monotonic()
+    monkeypatch.setattr(ssh, "monotonic", lambda: now)
+    pool = ssh.WorkerPool({"a.example": 2})
+
+    ejected = [
+        pool.release(pool.acquire(timeout=0), failed=True)
+        for _ in range(ssh.SSH_EJECT_AFTER)
+    ]
+    assert ejected[-1]
+    assert not any(ejected[:-1])
+    assert pool.acquire(timeout=0) is None
+
+    now += ssh.SSH_EJECT_SECONDS
+    assert pool.acquire(timeout=0).host == "a.example"
+
+
+def test_pool_success_resets_failures():
+    pool = ssh.WorkerPool({"a.example": 1})
+    for _ in range(ssh.SSH_EJECT_AFTER - 1):
+        pool.release(pool.acquire(timeout=0), failed=True)
+    pool.release(pool.acquire(timeout=0), failed=False)
+
+    assert not pool.release(pool.acquire(timeout=0), failed=True)
+
+
+def test_runners_avoid_failing_host(app, fake_ssh, monkeypatch):
+    monkeypatch.setattr(
+        scheduler, "workers", ssh.WorkerPool({"down.example": 1, "up.example": 1})
+    )
+    urls = [f"fsfe.org/reuse/api{i}" for i in range(6)]
+    with app.app_context():
+        db.session.add_all(Repository(url=url) for url in urls)
+        db.session.commit()
+
+    queue = DatabaseTaskQueue(app)
+    for url in urls:
+        queue.put_nowait(Task("https", url, "0" * 40))
+    runner = Runner(queue, app)
+    runner.start()
+    for _ in range(100):
+        if not len(queue):
+            break
+        sleep(0.1)
+    runner.join()
+
+    log = (fake_ssh / "log").read_text().splitlines()
+    lints = [line for line in log if "reuse_lint_repo" in line]
+    down = [line for line in lints if "down.example" in line]
+    # Each failure is retried once over a new master connection
+    assert len(down) == 2 * ssh.SSH_EJECT_AFTER
+    with app.app_context():
+        compliant = [url for url in urls if Repository.lookup(url).compliant]
+    assert len(compliant) == len(urls) - ssh.SSH_EJECT_AFTER
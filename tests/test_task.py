@@ -0,0 +1,70 @@
+from datetime import datetime
+from queue import Empty
+
+import pytest
+
+from reuse_api import task as module
+from reuse_api.models import QueuedTask, db
+from reuse_api.task import DatabaseTaskQueue, Priority, Task, TaskQueue
+
+
+def test_priority_lanes_without_starvation(monkeypatch):
+    monkeypatch.setattr(module, "QUEUE_STARVATION_LIMIT", 2)
+    queue = TaskQueue()
+    bulk = [Task("https", f"fsfe.org/bulk/{i}", "0" * 40) for i in range(3)]
+    new = [Task("https", f"fsfe.org/new/{i}", "0" * 40) for i in range(4)]
+    for task in bulk:
+        queue.put_nowait(task, Priority.BULK)
+    queue.put_nowait(new[0], Priority.OUTDATED)
+    for task in new[1:]:
+        queue.put_nowait(task, Priority.NEW)
+
+    # Deduplication is independent of the lane
+    assert new[0] in queue
+    assert len(queue) == len(bulk) + len(new)
+
+    served = [queue.get_nowait() for _ in range(len(bulk) + len(new))]
+    for task in served:
+        queue.done(task)
+
+    assert served == [new[1], new[2], bulk[0], new[0], new[3], bulk[1], bulk[2]]
+    assert len(queue) == 0
+
+
+def test_database_queue_is_shared(app, monkeypatch):
+    monkeypatch.setattr(module, "NB_RUNNER", 1)
+    first, second = DatabaseTaskQueue(app), DatabaseTaskQueue(app)
+    second._owner = "other-host:1"  # noqa: SLF001
+    task = Task("https", "fsfe.org/reuse/api", "0" * 40)
+    other = Task("https", "fsfe.org/reuse/tool", "1" * 40)
+
+    first.put_nowait(task, Priority.NEW)
+    second.put_nowait(task._replace(url=task.url.upper()), Priority.NEW)
+    second.put_nowait(other, Priority.BULK)
+    assert task in second
+    assert len(first) == 2  # noqa: PLR2004
+
+    assert first.get(timeout=0) == task
+    # Only one task may be worked on at a time across all processes
+    with pytest.raises(Empty):
+        second.get(timeout=0)
+
+    first.done(task)
+    assert task not in second
+    assert second.get(timeout=0) == other
+
+
+def test_database_queue_reclaims_expired_lease(app):
+    queue = DatabaseTaskQueue(app)
+    task = Task("https", "fsfe.org/reuse/api", "0" * 40)
+    queue.put_nowait(task)
+    assert queue.get(timeout=0) == task
+    with pytest.raises(Empty):
+        queue.get(timeout=0)
+
+    with app.app_context():
+        row = db.session.get(QueuedTask, task.url)
+        row.lease_until = datetime(2000, 1, 1)
+        db.session.commit()
+
+    assert queue.get(timeout=0) == task
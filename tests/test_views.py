@@ -1,4 +1,11 @@
+import gzip
+import json
+from datetime import datetime
 from http import HTTPStatus
+from threading import Event
+from time import sleep
+
+from reuse_api.views import BADGES
 
 
 REPO: str = "fsfe.org/reuse/api"
@@ -40,3 +47,374 @@ def test_register_failed_due_to_schema(client):
 
     assert response.status_code == HTTPStatus.OK
     assert "Not a Git repository" in response.data.decode()
+
+
+def test_register_limits_concurrent_probes(client, monkeypatch):
+    from reuse_api import form  # noqa: PLC0415
+    from reuse_api.admission import Admission  # noqa: PLC0415
+
+    probes = Admission(limit=2, per_client=1, retry_after=15)
+    monkeypatch.setattr(form, "probes", probes)
+
+    with probes.admit("127.0.0.1"):
+        response = client.post("/register", data=gendata(REPO))
+        assert response.status_code == HTTPStatus.TOO_MANY_REQUESTS
+        assert response.headers["Retry-After"] == "15"
+
+        with probes.admit("192.0.2.1"):
+            response = client.post(
+                "/register",
+                data=gendata(REPO),
+                environ_base={"REMOTE_ADDR": "192.0.2.2"},
+            )
+            assert response.status_code == HTTPStatus.SERVICE_UNAVAILABLE
+            assert response.headers["Retry-After"] == "15"
+
+    assert len(probes) == 0
+
+
+def test_register_remembers_missing_repositories(client, monkeypatch):
+    from reuse_api import cache, scheduler  # noqa: PLC0415
+    from reuse_api.scheduler import (  # noqa: PLC0415
+        ForgeUnavailableError,
+        InvalidRepositoryError,
+    )
+
+    now = [1000.0]
+    monkeypatch.setattr(cache, "monotonic", lambda: now[0])
+    probes: list[str] = []
+
+    def latest_hash(protocol: str, url: str) -> str:
+        probes.append(url)
+        if url.endswith("/down"):
+            raise ForgeUnavailableError
+        raise InvalidRepositoryError
+
+    monkeypatch.setattr(scheduler, "latest_hash", latest_hash)
+
+    for url in (REPO, REPO, "fsfe.org/reuse/down", "fsfe.org/reuse/down"):
+        response = client.post("/register", data=gendata(url))
+        assert "Not a Git repository" in response.data.decode()
+    # The missing repository is only probed once, the unreachable one twice
+    assert probes.count(REPO) == 3  # noqa: PLR2004
+    assert probes.count("fsfe.org/reuse/down") == 6  # noqa: PLR2004
+
+    now[0] += cache.invalid_cache._ttl
+    client.post("/register", data=gendata(REPO))
+    assert probes.count(REPO) == 6  # noqa: PLR2004
+
+
+def test_client_address_behind_proxy(app, monkeypatch):
+    from flask import request  # noqa: PLC0415
+
+    from reuse_api import config, create_app  # noqa: PLC0415
+
+    monkeypatch.setattr(config, "PROXY_HOPS", 1)
+    proxied = create_app()
+    proxied.add_url_rule("/address", "address", lambda: request.remote_addr)
+    try:
+        response = proxied.test_client().get(
+            "/address",
+            headers={"X-Forwarded-For": "198.51.100.7, 192.0.2.1"},
+            environ_base={"REMOTE_ADDR": "10.0.0.1"},
+        )
+    finally:
+        proxied.scheduler.join()
+
+    # Only the address added by the one trusted proxy counts
+    assert response.text == "192.0.2.1"
+
+
+def add_repository(app, url: str, **kwargs) -> None:
+    """Insert a repository row as if it had been checked before."""
+    from reuse_api.models import Repository, db  # noqa: PLC0415
+
+    with app.app_context():
+        db.session.add(Repository(url=url, **kwargs))
+        db.session.commit()
+
+
+def test_badge_unregistered(client):
+    response = client.get("/badge/" + REPO)
+
+    assert response.status_code == HTTPStatus.OK
+    assert response.mimetype == "image/svg+xml"
+    assert response.data == BADGES["unregistered"]
+
+
+def test_status_compliant(app, client, register, fake_git):
+    register(REPO)
+    add_repository(
+        app,
+        REPO,
+        hash=fake_git,
+        status="compliant",
+        lint_code=0,
+        last_access=datetime(2024, 1, 1),
+    )
+
+    response = client.get("/status/" + REPO)
+
+    assert response.status_code == HTTPStatus.OK
+    assert response.json == {
+        "hash": fake_git,
+        "status": "compliant",
+        "lint_code": 0,
+        "last_access": "2024-01-01T00:00:00",
+    }
+    assert client.get("/badge/" + REPO.upper()).data == BADGES["compliant"]
+
+
+def test_status_unregistered(client):
+    response = client.get("/status/" + REPO)
+
+    assert response.status_code == HTTPStatus.NOT_FOUND
+
+
+def test_badge_invalidated_by_new_result(app, client, register, fake_git):
+    from reuse_api.task import Task  # noqa: PLC0415
+
+    register(REPO)
+    add_repository(app, REPO)
+    assert client.get("/badge/" + REPO).data == BADGES["uninitialised"]
+
+    with app.app_context():
+        Task("https", REPO, fake_git).update_db(
+            '{"exit_code": 1, "lint_output": "", "spdx_output": ""}'
+        )
+
+    assert client.get("/badge/" + REPO).data == BADGES["non-compliant"]
+
+
+def test_conditional_requests(app, client, register, fake_git):
+    register(REPO)
+    add_repository(
+        app,
+        REPO,
+        hash=fake_git,
+        status="compliant",
+        lint_code=0,
+        spdx_output="SPDXVersion: SPDX-2.1",
+        last_access=datetime(2024, 1, 1),
+    )
+
+    for endpoint in ("/badge/", "/status/", "/sbom/"):
+        path = endpoint + REPO + (".spdx" if endpoint == "/sbom/" else "")
+        response = client.get(path)
+        assert response.status_code == HTTPStatus.OK
+        assert response.data
+
+        etag = response.headers["ETag"]
+        cached = client.get(path, headers={"If-None-Match": etag})
+        assert cached.status_code == HTTPStatus.NOT_MODIFIED
+        assert cached.headers["ETag"] == etag
+        assert not cached.data
+
+
+def test_status_does_not_wait_for_forge(app, client, register, monkeypatch):
+    from reuse_api import scheduler  # noqa: PLC0415
+    from reuse_api.cache import head_cache  # noqa: PLC0415
+
+    forge_answers = Event()
+
+    def slow_latest_hash(protocol: str, url: str) -> str:
+        forge_answers.wait()
+        return "1" * 40
+
+    monkeypatch.setattr(scheduler, "latest_hash", slow_latest_hash)
+    register(REPO)
+
+    response = client.get("/status/" + REPO)
+
+    assert response.status_code == HTTPStatus.OK
+    assert response.json["status"] == "uninitialised"
+    assert head_cache.get(REPO) is None
+
+    forge_answers.set()
+    for _ in range(50):
+        if head_cache.get(REPO):
+            break
+        sleep(0.1)
+    assert head_cache.get(REPO) == ("https", "1" * 40)
+
+
+def test_status_batch(app, client, register, monkeypatch):
+    from sqlalchemy import event  # noqa: PLC0415
+
+    from reuse_api import scheduler  # noqa: PLC0415
+    from reuse_api.models import db  # noqa: PLC0415
+
+    def latest_hash(protocol: str, url: str) -> str:
+        raise AssertionError("batch requests must not wait for the forge")
+
+    monkeypatch.setattr(scheduler, "latest_hash", latest_hash)
+    register(REPO, "fsfe.org/reuse/tool")
+    add_repository(
+        app,
+        REPO,
+        hash="0" * 40,
+        status="compliant",
+        lint_code=0,
+        last_access=datetime(2024, 1, 1),
+    )
+    statements = []
+    with app.app_context():
+        event.listen(
+            db.engine,
+            "before_cursor_execute",
+            lambda _conn, _cursor, statement, *_: statements.append(statement),
+        )
+
+    urls = [REPO.upper(), "fsfe.org/reuse/tool", "fsfe.org/reuse/unknown"]
+    response = client.post("/status", json={"urls": urls})
+
+    assert response.status_code == HTTPStatus.OK
+    assert response.json["repositories"] == {
+        REPO.upper(): {
+            "hash": "0" * 40,
+            "status": "compliant",
+            "lint_code": 0,
+            "last_access": "2024-01-01T00:00:00",
+        },
+        "fsfe.org/reuse/tool": {
+            "hash": None,
+            "status": "uninitialised",
+            "lint_code": None,
+            "last_access": None,
+        },
+        "fsfe.org/reuse/unknown": {
+            "hash": None,
+            "status": "unregistered",
+            "lint_code": None,
+            "last_access": None,
+        },
+    }
+    assert len(statements) == 1
+
+
+def test_status_batch_refresh(app, client, register, fake_git):
+    from reuse_api.cache import head_cache  # noqa: PLC0415
+    from reuse_api.models import Repository  # noqa: PLC0415
+
+    register(REPO)
+
+    response = client.post("/status", json={"urls": [REPO], "refresh": True})
+
+    assert response.json["repositories"][REPO]["status"] == "uninitialised"
+    for _ in range(50):
+        if head_cache.get(REPO):
+            break
+        sleep(0.1)
+    assert head_cache.get(REPO) == ("https", fake_git)
+    with app.app_context():
+        assert Repository.lookup(REPO) is not None
+
+
+def test_status_batch_invalid(client, monkeypatch):
+    from reuse_api import views  # noqa: PLC0415
+
+    monkeypatch.setattr(views, "STATUS_BATCH_LIMIT", 2)
+
+    for body in (None, {"urls": REPO}, {"urls": [1]}):
+        response = client.post("/status", json=body)
+        assert response.status_code == HTTPStatus.BAD_REQUEST
+        assert "error" in response.json
+
+    response = client.post("/status", json={"urls": [REPO] * 3})
+    assert response.status_code == HTTPStatus.REQUEST_ENTITY_TOO_LARGE
+
+
+def test_projects_listing(app, client, register, fake_git):
+    from reuse_api.task import Task  # noqa: PLC0415
+
+    urls = [f"fsfe.org/reuse/repo{i}" for i in range(3)]
+    register(*urls)
+    for i, url in enumerate(urls):
+        add_repository(
+            app, url, status="compliant", last_access=datetime(2024, 1, 1 + i)
+        )
+
+    response = client.get("/projects")
+    assert response.status_code == HTTPStatus.OK
+    assert [url for url in urls if url.encode() in response.data] == urls
+    assert response.data.index(urls[2].encode()) < response.data.index(urls[0].encode())
+    assert b"<strong>3</strong>" in client.get("/").data
+
+    with app.app_context():
+        Task("https", urls[2], fake_git).update_db(
+            '{"exit_code": 1, "lint_output": "", "spdx_output": ""}'
+        )
+        Task("https", urls[0], fake_git).update_db(
+            '{"exit_code": 0, "lint_output": "", "spdx_output": ""}'
+        )
+
+    response = client.get("/projects")
+    assert urls[2].encode() not in response.data
+    assert response.data.index(urls[0].encode()) < response.data.index(urls[1].encode())
+    assert b"<strong>2</strong>" in client.get("/").data
+    assert client.get("/projects/page/2").status_code == HTTPStatus.NOT_FOUND
+
+
+def test_sbom_content_negotiation(app, client, register, fake_git):
+    spdx = "SPDXVersion: SPDX-2.1\n" * 10000
+    register(REPO)
+    add_repository(
+        app,
+        REPO,
+        hash=fake_git,
+        status="compliant",
+        lint_code=0,
+        spdx_output=spdx,
+        last_access=datetime(2024, 1, 1),
+    )
+    path = f"/sbom/{REPO}.spdx"
+
+    compressed = client.get(path, headers={"Accept-Encoding": "gzip, deflate"})
+    assert compressed.headers["Content-Encoding"] == "gzip"
+    assert "Accept-Encoding" in compressed.headers["Vary"]
+    assert gzip.decompress(compressed.data).decode() == spdx
+
+    plain = client.get(path, headers={"Accept-Encoding": "identity"})
+    assert "Content-Encoding" not in plain.headers
+    assert plain.is_streamed
+    assert plain.get_data(as_text=True) == spdx
+    assert plain.headers["ETag"] != compressed.headers["ETag"]
+
+
+def test_analytics_export(app, client):
+    for i, status in enumerate(["compliant", "non-compliant", "compliant"]):
+        add_repository(
+            app,
+            f"fsfe.org/reuse/repo{i}",
+            status=status,
+            last_access=datetime(2024, 1, 1),
+        )
+    url = "/admin/analytics/{}.json"
+
+    everything = client.post(
+        url.format("all_projects"), data={"admin_key": "admin_key"}
+    )
+    assert everything.is_streamed
+    assert [r["url"] for r in everything.json] == [
+        "fsfe.org/reuse/repo0",
+        "fsfe.org/reuse/repo1",
+        "fsfe.org/reuse/repo2",
+    ]
+    assert everything.json[0]["last_access"] == "Mon, 01 Jan 2024 00:00:00 GMT"
+
+    compliant = client.post(
+        url.format("projects_by_status"),
+        data={"admin_key": "admin_key", "status": "compliant", "format": "ndjson"},
+    )
+    assert compliant.mimetype == "application/x-ndjson"
+    lines = compliant.get_data(as_text=True).splitlines()
+    assert [json.loads(line)["url"] for line in lines] == [
+        "fsfe.org/reuse/repo0",
+        "fsfe.org/reuse/repo2",
+    ]
+
+    nothing = client.post(
+        url.format("projects_by_status"),
+        data={"admin_key": "admin_key", "status": "uninitialised"},
+    )
+    assert nothing.json == []